@@ -0,0 +1,260 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# annotationserver.py
+#
+# Resident process that holds feature indexes and variant database handles for many mucor runs.
+# Start it once per machine:
+#     python annotationserver.py -s ~/mucor.sock
+# and set "server" in the JSON config (mucor_config.py --server ~/mucor.sock).
+# Each run then asks the server for its feature index and databases, instead of loading its own;
+# the server loads each one on first request, and keeps it for all later runs.
+# Only the user running the server can connect: the socket and its key file (the socket path + ".key") are created private to that user,
+# and every connection must prove it holds the key before any request is read.
+from __future__ import print_function
+import os
+import sys
+import stat
+import argparse
+import threading
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+# mucor modules
+from featureindex import KnownFeatures
+from databases import checkAndOpen
+try:
+    import tabix
+except ImportError:
+    pass
+
+# random bytes of the key shared through the key file
+AUTHKEY_BYTES = 32
+
+def abortWithMessage(message):
+    print("*** FATAL ERROR: " + message + " ***")
+    exit(2)
+
+class AnnotationServer(object):
+    '''
+    Serves feature index lookups and database queries over a Unix socket.
+    Every request is a tuple (command, arguments...); every reply is ('ok', value) or ('error', exception name, message).
+    '''
+
+    def __init__(self, address):
+        self.address = address
+        self.featureIndexes = {}    # (gff, featureType, fast, union) => FeatureIndex
+        self.databases = {}         # database path => tabix handle
+        self.databaseLocks = {}     # database path => lock held while its handle is queried, as connection threads share it
+        self.loadLock = threading.Lock()
+        self.commands = {   "featureIndex": self.featureIndex,
+                            "find": self.find,
+                            "featureLocation": self.featureLocation,
+                            "database": self.database,
+                            "query": self.query }
+
+    def serve(self):
+        '''Accept connections until interrupted; each connection is served by its own thread'''
+        keyFileName = authkeyFileName(self.address)
+        for fn in [self.address, keyFileName]:
+            if os.path.exists(fn):
+                # left behind by a server that did not shut down cleanly
+                os.remove(fn)
+        # only the user running the server may read the key or connect: both files are created without group and other permissions
+        oldUmask = os.umask(stat.S_IXUSR | stat.S_IRWXG | stat.S_IRWXO)
+        try:
+            authkey = os.urandom(AUTHKEY_BYTES)
+            keyFile = os.fdopen(os.open(keyFileName, os.O_WRONLY | os.O_CREAT | os.O_EXCL, stat.S_IRUSR | stat.S_IWUSR), 'wb')
+            try:
+                keyFile.write(authkey)
+            finally:
+                keyFile.close()
+            listener = Listener(self.address, family='AF_UNIX', authkey=authkey)
+        finally:
+            os.umask(oldUmask)
+        print("Annotation server listening on " + self.address)
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, IOError) as err:
+                    # a client without the key, or one that hung up before answering the challenge
+                    print("Refused a connection: {0}".format(err))
+                    continue
+                thread = threading.Thread(target=self.handle, args=(conn,))
+                thread.daemon = True
+                thread.start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+            os.remove(keyFileName)
+
+    def handle(self, conn):
+        '''Answer the requests of one mucor run until it disconnects'''
+        try:
+            while True:
+                request = conn.recv()
+                try:
+                    reply = ('ok', self.commands[request[0]](*request[1:]))
+                except (Exception, SystemExit) as err:
+                    # abortWithMessage in a loader raises SystemExit; report it to the run rather than losing this thread
+                    traceback.print_exc()
+                    reply = ('error', type(err).__name__, str(err))
+                conn.send(reply)
+        except EOFError:
+            pass
+        finally:
+            conn.close()
+
+    def featureIndex(self, gffFileName, featureType, fast, union, workers, fingerprintMemo=True):
+        '''
+        Load the feature index on first request, as a mucor run would (from the archive if fast is set).
+        Returns (key, contigs, numFeatures, duplicateFeatures, unionIncompatible), key naming the index in later requests
+        '''
+        key = (gffFileName, featureType, fast, bool(union))
+        with self.loadLock:
+            if key not in self.featureIndexes:
+                # imported here, as only the server process needs the GFF/GTF loading of mucor.py
+                import mucor
+                knownFeatures, self.featureIndexes[key] = mucor.parseGffFile(gffFileName, featureType, fast, union, workers, fingerprintMemo=fingerprintMemo)
+        featureIndex = self.featureIndexes[key]
+        return key, featureIndex.contigs, featureIndex.numFeatures(), featureIndex.duplicateFeatures, featureIndex.unionIncompatible
+
+    def find(self, key, contigs, positions):
+        return self.featureIndexes[key].findMany(contigs, positions)
+
+    def featureLocation(self, key, name):
+        return self.featureIndexes[key].featureLocation(name)
+
+    def database(self, db):
+        '''Open the database on first request. Returns whether it could be opened'''
+        with self.loadLock:
+            if db not in self.databases:
+                self.databases[db] = checkAndOpen(db)
+                self.databaseLocks[db] = threading.Lock()
+        return self.databases[db] is not None
+
+    def query(self, db, chrom, start, end):
+        '''Return the rows of the database in the region, read in full while holding the lock of the database'''
+        with self.databaseLocks[db]:
+            return [ list(row) for row in self.databases[db].query(chrom, start, end) ]
+
+class AnnotationClient(object):
+    '''Connection from a mucor run to an annotation server'''
+
+    def __init__(self, address):
+        self.address = address
+        keyFile = open(authkeyFileName(address), 'rb')
+        try:
+            authkey = keyFile.read()
+        finally:
+            keyFile.close()
+        self.conn = Client(address, family='AF_UNIX', authkey=authkey)
+
+    def request(self, *request):
+        '''Send one request and return the value of its reply, re-raising errors of the server'''
+        self.conn.send(request)
+        reply = self.conn.recv()
+        if reply[0] == 'ok':
+            return reply[1]
+        if reply[1] == 'TabixError' and 'tabix' in sys.modules:
+            raise tabix.TabixError(reply[2])
+        if reply[1] == 'KeyError':
+            raise KeyError(reply[2])
+        if reply[1] == 'SystemExit':
+            abortWithMessage("annotation server at {0} aborted the request; see its output".format(self.address))
+        raise RuntimeError("annotation server: {0}: {1}".format(reply[1], reply[2]))
+
+    def featureIndex(self, gffFileName, featureType, fast, union, workers=1, fingerprintMemo=True):
+        '''Return a RemoteFeatureIndex for the GFF/GTF file, feature type and union setting'''
+        if fast:
+            fast = os.path.abspath(os.path.expanduser(fast))
+        key, contigs, numFeatures, duplicateFeatures, unionIncompatible = self.request('featureIndex', os.path.abspath(gffFileName), featureType, fast, bool(union), workers, fingerprintMemo)
+        return RemoteFeatureIndex(self, key, contigs, numFeatures, duplicateFeatures, unionIncompatible)
+
+    def database(self, db):
+        '''Return a RemoteDatabase for the bgzipped, tabix indexed database VCF, or None if the server could not open it'''
+        db = os.path.abspath(os.path.expanduser(db))
+        if self.request('database', db):
+            return RemoteDatabase(self, db)
+        return None
+
+class RemoteFeatureIndex(object):
+    '''Stands in for a FeatureIndex held by the annotation server'''
+
+    def __init__(self, client, key, contigs, numberOfFeatures, duplicateFeatures, unionIncompatible):
+        self.client = client
+        self.key = key
+        self.contigs = contigs
+        self.numberOfFeatures = numberOfFeatures
+        self.duplicateFeatures = duplicateFeatures
+        self.unionIncompatible = unionIncompatible
+
+    def findMany(self, contigs, positions):
+        '''See FeatureIndex.findMany. All positions are sent in a single request'''
+        return self.client.request('find', self.key, list(contigs), list(positions))
+
+    def featureLocation(self, name):
+        return self.client.request('featureLocation', self.key, name)
+
+    def numFeatures(self):
+        return self.numberOfFeatures
+
+    def knownFeatures(self):
+        return KnownFeatures(self)
+
+class RemoteDatabase(object):
+    '''Stands in for the tabix handle of a database opened by the annotation server; see databases.dbLookup'''
+
+    def __init__(self, client, db):
+        self.client = client
+        self.db = db
+
+    def query(self, chrom, start, end):
+        return self.client.request('query', self.db, chrom, start, end)
+
+def authkeyFileName(address):
+    '''Path of the file holding the key of the annotation server at the Unix socket address'''
+    return address + ".key"
+
+# one connection per server address, shared by everything in this run
+clients = {}
+
+def connect(address):
+    '''Return the connection to the annotation server at the Unix socket address, connecting on first use'''
+    address = str(os.path.abspath(os.path.expanduser(address)))
+    if address not in clients:
+        try:
+            clients[address] = AnnotationClient(address)
+        except (IOError, OSError, AuthenticationError) as err:
+            abortWithMessage("Could not connect to annotation server at {0}: {1}".format(address, err))
+    return clients[address]
+
+def main():
+    '''
+    Run the annotation server in the foreground until interrupted (Ctrl-C).
+    Feature indexes and databases are loaded when a mucor run first asks for them, and kept until the server exits.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--socket", required=True, help="Path of the Unix socket on which to listen")
+    args = parser.parse_args()
+    AnnotationServer(os.path.abspath(os.path.expanduser(args.socket))).serve()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# bench_parsers.py
+#
+# Microbenchmark of the parse functions of inputs.py, for each supported variant caller.
+# Rows of a synthetic file are read into memory first, so only parsing is timed, in two ways:
+# per row, as parseVariantFile did before Parser.rowParser: a new inputs.Parser for every row,
+# looking up the parse function of the source and decoding the row in full (see baselineParse and baselineParseOut),
+# into variants of the class Variant was then (BaselineVariant) with annotations parsed uncached (baselineEFC);
+# and resolved, with the parse function looked up once per file, as parseVariantFile does now.
+# All rows share one EFF annotation, so the resolved parse finds it in inputs.annotationCache after the first row:
+# the best case of the cache, as at a site recurring across a cohort.
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import HTSeq
+
+# mucor modules
+import inputs
+from variant import Variant
+
+# FORMAT column, and the values of one sample, for each VCF source
+VCF_FORMATS = { "MiSeq": ("GT:AD:DP:VF", "0/1:40,10:50:0.2"),
+                "IonTorrent": ("GT:DP:RO:AO", "0/1:50:40:10"),
+                "SomaticIndelDetector": ("GT:AD:DP", "0/1:40,10:50"),
+                "Mutect": ("GT:AD:BQ:DP:FA", "0/1:40,10:30:50:0.200"),
+                "Samtools": ("GT:DP4:DP", "0/1:20,20,5,5:50"),
+                "VarScan": ("GT:DP:FREQ", "0/1:50:20%"),
+                "HaplotypeCaller": ("GT:AD:DP", "0/1:40,10:50"),
+                "FreeBayes": ("GT:DP:RO:AO", "0/1:50:40:10"),
+                "GenericGATK": ("GT:AD:DP", "0/1:40,10:50"),
+                "INFOCol": ("GT", "0/1") }
+
+VCF_HEADER = '''##fileformat=VCFv4.1
+##INFO=<ID=DP,Number=1,Type=Integer,Description="Total Depth">
+##INFO=<ID=AF,Number=A,Type=Float,Description="Allele Frequency">
+##INFO=<ID=EFF,Number=.,Type=String,Description="Predicted effects">
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1
+'''
+VCF_INFO = "DP=50;AF=0.2;EFF=NON_SYNONYMOUS_CODING(MODERATE|MISSENSE|Gcc/Tcc|A12S|100|GENE1|protein_coding|CODING|TX1|2|1)"
+
+OUT_COLUMNS = ['contig', 'position', 'context', 'ref_allele', 'alt_allele', 'tumor_name', 'normal_name', 'score', 'dbsnp_site',
+               'covered', 'power', 'tumor_power', 'normal_power', 'total_pairs', 'improper_pairs', 'map_Q0_reads', 't_lod_fstar',
+               'tumor_f', 'contaminant_fraction', 'contaminant_lod', 't_ref_count', 't_alt_count', 't_ref_sum', 't_alt_sum',
+               't_ref_max_mapq', 't_alt_max_mapq', 't_ins_count', 't_del_count', 'normal_best_gt', 'init_n_lod',
+               'n_ref_count', 'n_alt_count', 'n_ref_sum', 'n_alt_sum', 'judgement']
+
+def vcfRows(source, numRows, tmpDir):
+    '''Write a VCF of numRows rows of the given source, and return its rows, unpacked, as parseVariantFile hands them to the parser'''
+    fn = os.path.join(tmpDir, source + ".vcf")
+    vcf = open(fn, 'w')
+    vcf.write(VCF_HEADER)
+    formatColumn, sampleColumn = VCF_FORMATS[source]
+    for i in range(numRows):
+        vcf.write("\t".join(["chr1", str(1000 + 10 * i), ".", "C", "T", "50", "PASS", VCF_INFO, formatColumn, sampleColumn]) + "\n")
+    vcf.close()
+    varReader = HTSeq.VCF_Reader(fn)
+    varReader.parse_meta()
+    varReader.make_info_dict()
+    rows = []
+    for row in varReader:
+        row.unpack_info(varReader.infodict)
+        rows.append(row)
+    return rows
+
+def outRows(numRows):
+    '''Return the header column numbers, and numRows rows, of a MuTect '.out' file, as read by csv.reader'''
+    fieldId = dict(zip(OUT_COLUMNS, range(len(OUT_COLUMNS))))
+    rows = []
+    for i in range(numRows):
+        row = ['0'] * len(OUT_COLUMNS)
+        row[0], row[1], row[3], row[4] = "chr1", str(1000 + 10 * i), "C", "T"
+        row[fieldId['tumor_f']], row[fieldId['t_ref_count']], row[fieldId['t_alt_count']], row[fieldId['judgement']] = "0.200000", "40", "10", "KEEP"
+        rows.append(row)
+    return fieldId, rows
+
+class BaselineVariant:
+    '''Variant as it was before slots, with a per-instance __dict__ and the location as an HTSeq.GenomicPosition'''
+    def __init__(self, source, sample, pos, ref, alt, frac, dp, eff, fc):
+        self.source = source
+        self.sample = sample
+        self.pos = pos
+        self.ref = ref
+        self.alt = alt
+        self.frac = frac
+        self.dp = dp
+        self.eff = eff
+        self.fc = fc
+
+def baselineEFC(INFO):
+    '''inputs.parse_EFC as it was before inputs.annotationCache: every row's annotations are split anew'''
+    effect = ""
+    fc = ""
+    if 'EFF' in INFO:
+        fc = ";".join([x for x in set([ x.split('(')[0] for x in inputs.castList(INFO['EFF']) ])])
+        effect = ";".join([x for x in set([ x.split('|')[3] for x in inputs.castList(INFO['EFF']) if x.split('|')[3] ])])
+    elif 'ANN' in INFO:
+        fc = ";".join([x for x in set([ x.split('|')[1] for x in inputs.castList(INFO['ANN']) ])])
+        effect = ";".join([x for x in set([ x.split('|')[9] for x in inputs.castList(INFO['ANN']) ])])
+    elif 'FC' in INFO:
+        fc = ";".join([x for x in set( [y.split('_')[0] for y in inputs.castList(INFO['FC'])] )])
+        try:
+            effect = ";".join([x for x in set( [y.split('_')[1] for y in inputs.castList(INFO['FC'])] )])
+        except IndexError:
+            pass
+        if 'EXON' in INFO:
+            fc += ";EXON"
+    return effect, fc
+
+def baselineParse(parser, row, source):
+    '''
+    Parser.parse as it was before Parser.rowParser, kept here as the baseline of the benchmark:
+    the parse function of the source is looked up for the row, and every sample of it becomes a Variant
+    '''
+    parser.source = source
+    parser.row = row
+    alt = "/".join(sorted(row.alt))
+    pos = row.pos
+    effect, fc = baselineEFC(row.info)
+    out = []
+    samples_dict = parser.supported_formats[parser.source](row.samples)
+    for sample, vals in samples_dict.items():
+        out.append(BaselineVariant(source='', sample=sample, pos=pos, ref=row.ref, alt=alt, frac=vals[1], dp=vals[0], eff=effect, fc=fc))
+    return out
+
+def parseVCFPerRow(rows, source):
+    for row in rows:
+        parser = inputs.Parser()
+        baselineParse(parser, row, source)
+
+def parseVCFResolved(rows, source):
+    parseRow = inputs.Parser().rowParser(source)
+    for row in rows:
+        parseRow(row)
+
+def baselineParseOut(parser):
+    '''Parser.parse_MuTectOUT as it was before inputs.muTectOutFields, kept here as the baseline of the benchmark'''
+    row = parser.row
+    fieldId = parser.fieldId
+    chrom = row[0]
+    ref = row[3]
+    alt = row[4]
+    effect = ""
+    fc = ""
+    vf = float(row[fieldId['tumor_f']])
+    dp = int(int(str(row[fieldId['t_ref_count']]).strip()) + int(str(row[fieldId['t_alt_count']]).strip()))
+    position = int(row[fieldId['position']])
+    return BaselineVariant(source=os.path.basename(parser.fn), sample='', pos=HTSeq.GenomicPosition(chrom, int(position)), ref=ref, alt=alt, frac=vf, dp=dp, eff=effect.strip(';'), fc=fc.strip(';'))
+
+def parseOutPerRow(rows, fieldId):
+    for row in rows:
+        parser = inputs.Parser()
+        parser.row = row
+        parser.fieldId = fieldId
+        parser.fn = "bench.out"
+        baselineParseOut(parser)
+
+def parseOutResolved(rows, fieldId):
+    fields = inputs.muTectOutFields(fieldId)
+    for row in rows:
+        chrom, position, ref, alt, vf, dp = fields(row)
+        Variant("bench.out", '', (chrom, position), ref, alt, vf, dp, '', '')
+
+def rowsPerSecond(function, rows, arg, repeats):
+    '''Return the rows per second of the fastest of repeats calls of function(rows, arg)'''
+    best = None
+    for i in range(repeats):
+        startTime = time.time()
+        function(rows, arg)
+        elapsed = time.time() - startTime
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(rows) / best
+
+def main():
+    '''
+    Time the parse function of each source, per row and resolved once, and report rows per second of each
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", type=int, default=20000, help="Number of rows to parse for each source. Default: 20000")
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="Number of timings of each source; the fastest is reported. Default: 3")
+    parser.add_argument("-s", "--source", dest='sources', action='append', help="Source to time. Can be declared >= 1 times. Default: all sources")
+    args = parser.parse_args()
+
+    sources = args.sources or sorted(VCF_FORMATS.keys()) + ["muTector"]
+    print("{0:<22}{1:>14}{2:>14}{3:>10}".format("source", "per row", "resolved", "speedup"))
+    tmpDir = tempfile.mkdtemp()
+    try:
+        for source in sources:
+            if source == "muTector":
+                fieldId, rows = outRows(args.rows)
+                before = rowsPerSecond(parseOutPerRow, rows, fieldId, args.repeats)
+                after = rowsPerSecond(parseOutResolved, rows, fieldId, args.repeats)
+            elif source in VCF_FORMATS:
+                rows = vcfRows(source, args.rows, tmpDir)
+                before = rowsPerSecond(parseVCFPerRow, rows, source, args.repeats)
+                after = rowsPerSecond(parseVCFResolved, rows, source, args.repeats)
+            else:
+                print("*** WARNING: No benchmark for source " + source + " ***")
+                continue
+            print("{0:<22}{1:>14.0f}{2:>14.0f}{3:>9.2f}x".format(source, before, after, after / before))
+    finally:
+        shutil.rmtree(tmpDir)
+    print("rows/sec, fastest of {0} runs of {1} rows".format(args.repeats, args.rows))
+
+if __name__ == "__main__":
+    main()
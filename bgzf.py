@@ -0,0 +1,144 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# bgzf.py
+#
+# Lines of a bgzipped file, inflated on a pool of threads.
+# BGZF is a series of gzip members of at most 64 KB each, whose compressed size is written in their header,
+# so the blocks can be found without inflating them, and inflated independently.
+# Blocks are read in batches; each batch is inflated by a thread of the pool (zlib releases the GIL while inflating),
+# and the batches are handed back in file order, so the lines come out as from gzip.open.
+import struct
+import zlib
+import itertools
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+# blocks inflated by one task of the pool; a block inflates to at most 64 KB, so a batch to at most 1 MB
+BATCH_BLOCKS = 16
+# compressed bytes read from the file at a time
+READ_BYTES = 1024 * 1024
+
+def isBgzf(fn):
+    '''Is the file bgzipped? Its first gzip member must have the BC extra subfield of BGZF'''
+    try:
+        bgzfFile = open(fn, 'rb')
+    except IOError:
+        return False
+    try:
+        header = bgzfFile.read(18)
+    finally:
+        bgzfFile.close()
+    # gzip magic and deflate, the FEXTRA flag, and the BC subfield of length 2 as the first subfield
+    return len(header) == 18 and header[:4] == "\x1f\x8b\x08\x04" and header[12:16] == "BC\x02\x00"
+
+def readBlocks(bgzfFile):
+    '''
+    Yield the blocks of a bgzipped file, open at its start, each as (deflated data, size inflated).
+    Raises IOError if the file ends within a block
+    '''
+    buf = ''
+    while True:
+        data = bgzfFile.read(READ_BYTES)
+        buf += data
+        start = 0
+        while len(buf) - start >= 18:
+            xlen = struct.unpack_from('<H', buf, start + 10)[0]
+            blockSize = blockSizeOf(buf, start, xlen)
+            if start + blockSize > len(buf):
+                break
+            isize = struct.unpack_from('<I', buf, start + blockSize - 4)[0]
+            yield buf[start + 12 + xlen:start + blockSize - 8], isize
+            start += blockSize
+        buf = buf[start:]
+        if not data:
+            if buf:
+                raise IOError("Truncated BGZF block")
+            return
+
+def blockBatches(bgzfFile, batchBlocks=BATCH_BLOCKS):
+    '''Yield the blocks of a bgzipped file, open at its start, in lists of batchBlocks blocks'''
+    blocks = readBlocks(bgzfFile)
+    while True:
+        batch = list(itertools.islice(blocks, batchBlocks))
+        if not batch:
+            return
+        yield batch
+
+def blockSizeOf(buf, start, xlen):
+    '''Return the size of the BGZF block at start of buf, from the BSIZE of the BC subfield of its extra field of xlen bytes'''
+    offset = start + 12
+    end = offset + xlen
+    while offset + 4 <= end:
+        subfieldLength = struct.unpack_from('<H', buf, offset + 2)[0]
+        if buf[offset:offset + 2] == "BC" and subfieldLength == 2:
+            return struct.unpack_from('<H', buf, offset + 4)[0] + 1
+        offset += 4 + subfieldLength
+    raise IOError("Not a BGZF block")
+
+def inflateBlocks(blocks):
+    '''Return the text of a batch of blocks. Raises IOError if a block inflates to another size than its header gives'''
+    texts = []
+    for data, isize in blocks:
+        text = zlib.decompress(data, -15)
+        if len(text) != isize:
+            raise IOError("Corrupt BGZF block")
+        texts.append(text)
+    return ''.join(texts)
+
+class BgzfLines(object):
+    '''
+    The lines of a bgzipped file, as iterating over gzip.open gives them, with the blocks inflated on threads threads.
+    Can be iterated any number of times, reading the file from its start each time
+    '''
+
+    def __init__(self, filename, threads=1):
+        self.filename = filename
+        self.threads = threads
+
+    def texts(self, bgzfFile):
+        '''Yield the inflated text of each batch of blocks of the file, in order'''
+        if self.threads <= 1:
+            for blocks in blockBatches(bgzfFile):
+                yield inflateBlocks(blocks)
+            return
+        pool = ThreadPool(self.threads)
+        try:
+            # keep a few batches in flight per thread, rather than queueing the whole file
+            pending = deque()
+            for blocks in blockBatches(bgzfFile):
+                pending.append(pool.apply_async(inflateBlocks, (blocks,)))
+                if len(pending) >= 2 * self.threads:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+
+    def __iter__(self):
+        bgzfFile = open(self.filename, 'rb')
+        try:
+            partial = ''
+            for text in self.texts(bgzfFile):
+                lines = (partial + text).split("\n")
+                partial = lines.pop()
+                for line in lines:
+                    yield line + "\n"
+            if partial:
+                yield partial
+        finally:
+            bgzfFile.close()
@@ -23,7 +23,15 @@ class Config(object):
             self.gff = ''
             self.union = False
             self.fast = False
+            self.fingerprintMemo = True # reuse the GFF/GTF digest recorded in the archive directory; see featureindex.cachedGffFingerprint
+            self.workers = 1
+            self.threads = 1        # threads inflating each bgzipped VCF input file; see bgzf.py
+            self.server = ''        # Unix socket of an annotation server; empty to load annotations in this run
+            self.vcfReader = 'htseq'    # reader of VCF input files; see vcfreader.py
+            self.parseCache = ''    # directory of cached parsed input files; see parsecache.py
+            self.memoryBudget = 0   # MB of variant rows to hold in memory, spilling the rest to disk; 0 for no limit
             self.featureType = ''
+            self.binnings = []      # (featureType, union) of every binning, the primary one first
             self.filters = []
             self.outputFormats = []
             self.samples = []
@@ -41,6 +49,7 @@ class Config(object):
                         "\tUnion: {3}\n" + \
                         "\tFast: {4}\n" + \
                         "\tAnnotation: {5}\n" + \
+                        "\tWorkers: {6}\n" + \
                         "\tDatabase(s): \n\t\t" + \
                         "\n\t\t".join(self.databases) + "\n" + \
                         "\tFilter(s): \n\t\t" + \
@@ -50,5 +59,5 @@ class Config(object):
                         "\tOutput Formats: \n\t\t" + \
                         "\n\t\t".join(self.outputFormats) + "\n"
         string_rep = string_rep.format(str(len(self.inputFiles)), self.featureType, \
-                                      self.outputDir, self.union, self.fast, self.gff)
+                                      self.outputDir, self.union, self.fast, self.gff, self.workers)
         return string_rep
@@ -87,8 +87,8 @@ def dbLookup(var, dbs):
         Better than '' when printing output // TO DO: consider '.' or removal entirely
     '''
 
-    spos = int(var.pos.pos - 1)     # start position
-    epos = int(var.pos.pos)         # end position
+    spos = int(var.position - 1)     # start position
+    epos = int(var.position)        # end position
     alts = str(var.alt).split(',')  # list of 1 or more alternative alleles 
     dbEntries = {}
 
@@ -97,7 +97,7 @@ def dbLookup(var, dbs):
             dbEntries[source] = '?'
             dbEntries[source + "_VAF"] = '?'
             try:
-                for row in tb.query(var.pos.chrom, spos, epos):
+                for row in tb.query(var.chrom, spos, epos):
                     if str(row[3]) == var.ref and str(row[4]) in alts:
                         # 3rd column (zero indexed = [2])
                         # in a VCF is the ID
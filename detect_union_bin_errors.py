@@ -49,20 +49,27 @@ def ThereAreCopies(locs):
         return True
     return False
 
-def WriteProblems(problems, outputDir):
-    output = open(outputDir + '/union_incompatible_genes.txt', 'w')
+def ProblemNames(problems):
+    # feature names to drop: the gene itself, and the relabeled GENE.contig copies on each affected contig
+    names = []
     for gene in problems.keys():
-        output.write(str(gene + '\n'))
+        names.append(gene)
         for contig in problems[gene]:
-            output.write(str(gene + '.' + contig + '\n'))
+            names.append(gene + '.' + contig)
+    return names
+
+def WriteProblems(problems, outputDir):
+    output = open(outputDir + '/union_incompatible_genes.txt', 'w')
+    for name in ProblemNames(problems):
+        output.write(str(name + '\n'))
     return True
 
 def main():
     '''
     This tool was designed to aid users running Mucor with --union while using feature type = gene_name. 
     It will find features with the same name on the same contig, which cause large, problematic feature bins when running Mucor with --union.
-    The output is a text document to be placed into the current working directory where Mucor will be executed
-        It will be read automatically if present at runtimme
+    The output is a text document listing these features, for inspection.
+        Mucor itself runs the same detection (FindProblems) while reading the annotation, and leaves these features out of the bins
     '''
     
     # Parse arguments
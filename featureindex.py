@@ -0,0 +1,421 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# featureindex.py
+#
+# Array-backed feature bins and the on-disk annotation archive
+from __future__ import print_function
+import os
+import json
+import shutil
+import hashlib
+import functools
+import tempfile
+from collections import defaultdict
+import numpy as np
+import HTSeq
+
+# mucor modules
+from mucorfeature import MucorFeature
+
+# bump whenever the layout of the archive changes; older archives are then ignored and rebuilt
+ARCHIVE_VERSION = 3
+
+# feature table arrays written to (and memory-mapped from) each archive directory
+ARCHIVE_ARRAYS = ['names', 'featureContigs', 'featureStarts', 'featureEnds', 'featureStrands']
+
+# arrays of each contig partition, written to a subdirectory of the archive per contig
+PARTITION_ARRAYS = ['starts', 'ends', 'setOffsets', 'setIds']
+
+class FeatureIndex(object):
+    '''
+    Feature bins as per-contig sorted arrays, equivalent to an unstranded HTSeq.GenomicArrayOfSets.
+    Every contig is cut into steps, [start, end) intervals covered by the same set of features.
+    The steps of one contig form a partition (starts, ends, setOffsets, setIds):
+    the set of step i is setIds[setOffsets[i]:setOffsets[i+1]], where each ID is the index of a feature name in names.
+    Steps covered by no feature are not stored.
+    Partitions that are not in memory yet are fetched with loadPartition(contig) on the first lookup on their contig,
+    so a run only reads the bins of the contigs its variants are on.
+    '''
+
+    def __init__(self, contigs, names, featureContigs, featureStarts, featureEnds, featureStrands, duplicateFeatures, unionIncompatible=(), partitions=None, loadPartition=None):
+        self.contigs = contigs                  # list of contig names
+        self.names = names                      # feature name, per feature ID
+        self.featureContigs = featureContigs    # index into contigs, per feature ID
+        self.featureStarts = featureStarts      # start of the knownFeatures interval, per feature ID
+        self.featureEnds = featureEnds          # end of the knownFeatures interval, per feature ID
+        self.featureStrands = featureStrands    # strand of the knownFeatures interval, per feature ID
+        self.duplicateFeatures = set(duplicateFeatures)
+        self.unionIncompatible = set(unionIncompatible) # feature names left out of the bins, see fromIntervals
+        self.partitions = dict(partitions or {})    # contig => (starts, ends, setOffsets, setIds)
+        self.loadPartition = loadPartition      # contig => partition, for contigs not in partitions yet
+        self.stepSets = {}                      # (contig, step) => frozenset of feature names, filled on first lookup
+        self.emptySet = frozenset()
+
+        self.nameList = [ str(x) for x in names.tolist() ]
+        self.contigIds = dict( (contig, i) for i, contig in enumerate(contigs) )
+
+    @classmethod
+    def fromIntervals(cls, intervals, features, duplicateFeatures, unionIncompatible=()):
+        '''
+        Build a FeatureIndex from a list of (contig, start, end, name) intervals, one per feature bin,
+        and a dictionary of feature name => (contig, start, end, strand) for knownFeatures.
+        Features named in unionIncompatible are left out entirely, both from the bins and from knownFeatures.
+        Yields the same sets as adding every interval to an unstranded GenomicArrayOfSets:
+        per contig, all interval starts and ends are sorted into step boundaries,
+        and each interval is expanded into the run of steps between its start and end.
+        '''
+        unionIncompatible = set(unionIncompatible)
+        names = sorted( x for x in features.keys() if x not in unionIncompatible )
+        nameIds = dict( (name, i) for i, name in enumerate(names) )
+        contigs = []
+        contigIds = {}
+        byContig = defaultdict(list)
+        for contig, start, end, name in intervals:
+            if name in unionIncompatible:
+                continue
+            if start > end:
+                raise ValueError("start is larger than end: {0} {1}:{2}-{3}".format(name, contig, start, end))
+            if contig not in contigIds:
+                contigIds[contig] = len(contigs)
+                contigs.append(contig)
+            byContig[contig].append((start, end, nameIds[name]))
+        for name in names:
+            # a feature without any interval (should not happen) still needs a valid contig
+            if features[name][0] not in contigIds:
+                contigIds[features[name][0]] = len(contigs)
+                contigs.append(features[name][0])
+
+        partitions = {}
+        for contig in contigs:
+            if not byContig[contig]:
+                partitions[contig] = emptyPartition()
+                continue
+            ivs = np.array(byContig[contig], dtype=np.int64)
+            boundaries = np.unique(ivs[:, :2])
+            first = np.searchsorted(boundaries, ivs[:, 0])
+            counts = np.searchsorted(boundaries, ivs[:, 1]) - first
+            # expand each interval into (step, feature ID) pairs
+            offsets = np.cumsum(counts) - counts
+            steps = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(offsets, counts)
+            featureIds = np.repeat(ivs[:, 2], counts)
+            # drop repeated pairs (e.g. overlapping exons of one gene), sort by step, then by feature ID
+            pairs = np.unique(steps * len(names) + featureIds)
+            steps = pairs // len(names)
+            usedSteps, stepCounts = np.unique(steps, return_counts=True)
+            partitions[contig] = (boundaries[usedSteps],
+                                  boundaries[usedSteps + 1],
+                                  np.concatenate([[0], np.cumsum(stepCounts)]).astype(np.int64),
+                                  (pairs % len(names)).astype(np.int32))
+        return cls.fromArrays(contigs, names,
+                              [ contigIds[features[x][0]] for x in names ],
+                              [ features[x][1] for x in names ],
+                              [ features[x][2] for x in names ],
+                              [ features[x][3] for x in names ],
+                              duplicateFeatures,
+                              unionIncompatible,
+                              partitions)
+
+    @classmethod
+    def fromArrays(cls, contigs, names, featureContigs, featureStarts, featureEnds, featureStrands, duplicateFeatures, unionIncompatible=(), partitions=None):
+        '''Build a FeatureIndex from plain python sequences, and a dictionary of contig => partition'''
+        return cls(list(contigs),
+                   np.array(names, dtype=np.string_),
+                   np.array(featureContigs, dtype=np.int32),
+                   np.array(featureStarts, dtype=np.int64),
+                   np.array(featureEnds, dtype=np.int64),
+                   np.array(featureStrands, dtype='S1'),
+                   duplicateFeatures,
+                   unionIncompatible,
+                   partitions)
+
+    def __getitem__(self, pos):
+        '''
+        Return the set of feature names at the given HTSeq.GenomicPosition.
+        Like the GenomicArrayOfSets, raises KeyError if the contig is unknown.
+        '''
+        resultSet = self.findMany([pos.chrom], [pos.pos])[0]
+        if resultSet is None:
+            raise KeyError(pos.chrom)
+        return resultSet
+
+    def partition(self, contig):
+        '''Return the partition of the contig, loading it on first use, or None if the contig is unknown'''
+        try:
+            return self.partitions[contig]
+        except KeyError:
+            if contig not in self.contigIds or self.loadPartition is None:
+                return None
+            self.partitions[contig] = self.loadPartition(contig)
+            return self.partitions[contig]
+
+    def findMany(self, contigs, positions):
+        '''
+        Return the sets of feature names at many positions at once, as a list aligned with the input.
+        All positions on a contig are resolved with a single searchsorted over the step starts.
+        Positions on contigs unknown to the index give None.
+        Positions in the same step share one frozenset, rather than each allocating its own.
+        '''
+        positions = np.asarray(positions, dtype=np.int64)
+        results = [None] * len(positions)
+        rowsByContig = defaultdict(list)
+        for row, contig in enumerate(contigs):
+            rowsByContig[contig].append(row)
+        for contig, rows in rowsByContig.items():
+            partition = self.partition(contig)
+            if partition is None:
+                continue
+            starts, ends = partition[0], partition[1]
+            if len(starts) == 0:
+                for row in rows:
+                    results[row] = self.emptySet
+                continue
+            rows = np.array(rows)
+            contigPositions = positions[rows]
+            steps = np.searchsorted(starts, contigPositions, side='right') - 1
+            hits = (steps >= 0) & (contigPositions < ends[np.maximum(steps, 0)])
+            for row, step, hit in zip(rows.tolist(), steps.tolist(), hits.tolist()):
+                if hit:
+                    results[row] = self.stepSet(contig, step)
+                else:
+                    results[row] = self.emptySet
+        return results
+
+    def stepSet(self, contig, step):
+        '''Return the frozenset of feature names covering the given step of the contig'''
+        try:
+            return self.stepSets[(contig, step)]
+        except KeyError:
+            setOffsets, setIds = self.partitions[contig][2:]
+            ids = setIds[setOffsets[step]:setOffsets[step + 1]]
+            self.stepSets[(contig, step)] = frozenset( self.nameList[x] for x in ids )
+            return self.stepSets[(contig, step)]
+
+    def featureLocation(self, name):
+        '''Return (contig, start, end, strand) of the knownFeatures interval of the feature name. Raises KeyError if the name is unknown'''
+        i = self.nameIds()[name]
+        return self.contigs[self.featureContigs[i]], int(self.featureStarts[i]), int(self.featureEnds[i]), str(self.featureStrands[i])
+
+    def numFeatures(self):
+        '''Return the number of features in the index'''
+        return len(self.nameList)
+
+    def nameIds(self):
+        '''Return the dictionary of feature name => feature ID, built on first use'''
+        try:
+            return self._nameIds
+        except AttributeError:
+            self._nameIds = dict( (name, i) for i, name in enumerate(self.nameList) )
+            return self._nameIds
+
+    def knownFeatures(self):
+        '''Return a fresh dictionary of feature name => MucorFeature, with empty variant sets, filled as features are looked up'''
+        return KnownFeatures(self)
+
+class KnownFeatures(dict):
+    '''
+    Dictionary of feature name => MucorFeature for a FeatureIndex, or any other index with featureLocation.
+    Only features that are looked up get a MucorFeature, rather than every feature of the genome up front.
+    '''
+
+    def __init__(self, featureIndex):
+        dict.__init__(self)
+        self.featureIndex = featureIndex
+
+    def __missing__(self, name):
+        # new MucorFeature, with an empty variant set
+        self[name] = MucorFeature(name, 'exon', HTSeq.GenomicInterval(*self.featureIndex.featureLocation(name)))
+        return self[name]
+
+def emptyPartition():
+    '''Return the partition of a contig without any steps'''
+    return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+
+def gffFingerprint(gffFileName, blockSize=1 << 20):
+    '''Return the SHA-1 hex digest of the contents of the GFF/GTF file'''
+    digest = hashlib.sha1()
+    gffFile = open(gffFileName, 'rb')
+    block = gffFile.read(blockSize)
+    while block:
+        digest.update(block)
+        block = gffFile.read(blockSize)
+    gffFile.close()
+    return digest.hexdigest()
+
+def cachedGffFingerprint(archiveDir, gffFileName, memo=True):
+    '''
+    Return the gffFingerprint of the file, reusing the digest recorded in archiveDir/fingerprints.json
+    for as long as the size, modification time, change time and inode of the file are unchanged.
+    Hashing a whole genome annotation takes far longer than opening the archive it selects.
+    The tradeoff: an edit that keeps those four, such as one within the timestamp resolution of the filesystem,
+    selects the archive of the earlier contents. The change time cannot be set back, so restoring the modification time
+    after an edit (cp -p, rsync, touch -r) does not hide it. With memo unset, the file is hashed on every call
+    and the recorded digests are neither read nor written.
+    '''
+    if not memo:
+        return gffFingerprint(gffFileName)
+    archiveDir = os.path.expanduser(archiveDir)
+    key = os.path.abspath(gffFileName)
+    stat = os.stat(gffFileName)
+    signature = [stat.st_size, stat.st_mtime, stat.st_ctime, stat.st_ino]
+    memoPath = os.path.join(archiveDir, 'fingerprints.json')
+    try:
+        memoFile = open(memoPath)
+        memo = json.load(memoFile)
+        memoFile.close()
+    except (IOError, ValueError):
+        memo = {}
+    if key in memo and memo[key][:4] == signature:
+        return str(memo[key][4])
+    fingerprint = gffFingerprint(gffFileName)
+    memo[key] = signature + [fingerprint]
+    makeArchiveDir(archiveDir)
+    # write and rename, so a concurrent run never reads a partial file; if two runs race, either memo is valid
+    memoFd, tmpPath = tempfile.mkstemp(prefix='.fingerprints.', dir=archiveDir)
+    memoFile = os.fdopen(memoFd, 'w')
+    json.dump(memo, memoFile)
+    memoFile.close()
+    os.chmod(tmpPath, 0o644)
+    os.rename(tmpPath, memoPath)
+    return fingerprint
+
+def makeArchiveDir(archiveDir):
+    '''Create the archive directory if it does not exist yet'''
+    if not os.path.exists(archiveDir):
+        try:
+            os.makedirs(archiveDir)
+        except OSError:
+            # another process created it first
+            pass
+
+def archiveMeta(fingerprint, featureType, union):
+    '''Return the meta data that an archive of this GFF/GTF contents, feature type and union status must match'''
+    return { 'gffFingerprint': fingerprint, 'featureType': featureType, 'union': bool(union) }
+
+def archivePath(archiveDir, gffFileName, featureType, union, fingerprint):
+    '''
+    Return the archive directory for this combination of GFF/GTF contents, feature type and union status.
+    The file name is kept in the path only to make the archive directory human readable.
+    '''
+    if union:
+        unionstatus = "union"
+    else:
+        unionstatus = "no_union"
+    annotFileName = os.path.splitext(os.path.basename(gffFileName))[0]
+    return os.path.join(os.path.expanduser(archiveDir), "{0}_{1}_{2}_{3}.v{4}".format(annotFileName, featureType, unionstatus, fingerprint[:16], ARCHIVE_VERSION))
+
+def saveArchive(index, path, meta):
+    '''
+    Write the index to the archive directory path.
+    The archive is written to a temporary directory next to path and renamed into place,
+    so concurrent readers either see a complete archive or none at all.
+    If another process finished the same archive first, theirs is kept and ours discarded.
+    '''
+    parent = os.path.dirname(path)
+    makeArchiveDir(parent)
+    tmpDir = tempfile.mkdtemp(prefix='.' + os.path.basename(path) + '.', dir=parent)
+    try:
+        for name in ARCHIVE_ARRAYS:
+            np.save(os.path.join(tmpDir, name + '.npy'), getattr(index, name))
+        os.mkdir(os.path.join(tmpDir, 'contigs'))
+        for i, contig in enumerate(index.contigs):
+            for name, array in zip(PARTITION_ARRAYS, index.partition(contig)):
+                np.save(partitionPath(tmpDir, i, name), array)
+        meta = dict(meta)
+        meta['version'] = ARCHIVE_VERSION
+        meta['contigs'] = index.contigs
+        meta['duplicateFeatures'] = sorted(index.duplicateFeatures)
+        meta['unionIncompatible'] = sorted(index.unionIncompatible)
+        metaFile = open(os.path.join(tmpDir, 'meta.json'), 'w')
+        json.dump(meta, metaFile)
+        metaFile.close()
+        os.chmod(tmpDir, 0o755)
+        os.rename(tmpDir, path)
+    except OSError:
+        # path already exists: a concurrent run beat us to it
+        shutil.rmtree(tmpDir, ignore_errors=True)
+        return False
+    return True
+
+def partitionPath(path, contigId, name):
+    '''Return the file of one array of a contig partition. Contigs are numbered, as their names need not be valid file names'''
+    return os.path.join(path, 'contigs', '{0}.{1}.npy'.format(contigId, name))
+
+def loadPartition(path, contigIds, contig):
+    '''Memory-map the partition of the contig from the archive at path'''
+    return tuple( np.load(partitionPath(path, contigIds[contig], name), mmap_mode='r') for name in PARTITION_ARRAYS )
+
+def loadArchive(path, meta):
+    '''
+    Memory-map the feature table of the archive at path and return a FeatureIndex,
+    or None if the archive is missing or does not match the expected meta data.
+    The partition of each contig is only mapped on the first lookup on that contig.
+    '''
+    try:
+        metaFile = open(os.path.join(path, 'meta.json'))
+        stored = json.load(metaFile)
+        metaFile.close()
+    except (IOError, ValueError):
+        return None
+    if stored.get('version') != ARCHIVE_VERSION:
+        return None
+    for key, value in meta.items():
+        if stored.get(key) != value:
+            return None
+    arrays = {}
+    for name in ARCHIVE_ARRAYS:
+        arrays[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+    contigs = [ str(x) for x in stored['contigs'] ]
+    contigIds = dict( (contig, i) for i, contig in enumerate(contigs) )
+    return FeatureIndex(contigs, duplicateFeatures=[ str(x) for x in stored['duplicateFeatures'] ],
+                        unionIncompatible=[ str(x) for x in stored['unionIncompatible'] ],
+                        loadPartition=functools.partial(loadPartition, path, contigIds), **arrays)
+
+def checkArchive(path, meta):
+    '''
+    Load the archive at path, and every one of its partitions, and check that the arrays are consistent.
+    Returns a list of problems found; empty if the archive is valid
+    '''
+    index = loadArchive(path, meta)
+    if index is None:
+        return ["missing, or does not match " + str(meta)]
+    problems = []
+    numFeatures = index.numFeatures()
+    for name in ['featureContigs', 'featureStarts', 'featureEnds', 'featureStrands']:
+        if len(getattr(index, name)) != numFeatures:
+            problems.append("{0} has {1} entries for {2} features".format(name, len(getattr(index, name)), numFeatures))
+    for contig in index.contigs:
+        try:
+            starts, ends, setOffsets, setIds = index.partition(contig)
+        except (IOError, ValueError) as err:
+            problems.append("{0}: cannot load partition: {1}".format(contig, err))
+            continue
+        if len(ends) != len(starts) or len(setOffsets) != len(starts) + 1 or setOffsets[-1] != len(setIds):
+            problems.append("{0}: partition arrays have inconsistent lengths".format(contig))
+        elif len(starts) and (np.any(starts >= ends) or np.any(starts[1:] < ends[:-1]) or np.any(np.diff(setOffsets) <= 0)):
+            problems.append("{0}: steps are empty, unsorted or overlapping".format(contig))
+        elif len(setIds) and (setIds.min() < 0 or setIds.max() >= numFeatures):
+            problems.append("{0}: feature IDs out of range".format(contig))
+    return problems
+
+def archiveSize(path):
+    '''Return the total size in bytes of the files of the archive at path'''
+    size = 0
+    for dirName, subDirs, fileNames in os.walk(path):
+        for fileName in fileNames:
+            size += os.path.getsize(os.path.join(dirName, fileName))
+    return size
@@ -0,0 +1,303 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# gffreader.py
+#
+# Streaming GFF/GTF scanner for building feature bins.
+# HTSeq.GFF_Reader parses the attribute column of every line into a dictionary;
+# here, lines are rejected on the type and contig columns first,
+# and only the attribute named by the feature type is extracted from the lines that remain.
+import os
+import re
+import sys
+import gzip
+import struct
+import itertools
+from collections import defaultdict
+import multiprocessing
+from array import array
+from cStringIO import StringIO
+try:
+    import tabix
+except ImportError:
+    pass
+try:
+    import pysam
+except ImportError:
+    pass
+
+# tabix can address positions up to 2^29; a query up to here covers a whole contig
+TABIX_MAX_POSITION = 1 << 29
+
+def attributePattern(featureType):
+    '''
+    Return a compiled regex finding the value of attribute featureType in a GTF (key "value") or GFF3 (key=value) attribute column.
+    Mirrors HTSeq.parse_GFF_attribute_string: the value runs to the next ';' outside quotes.
+    '''
+    return re.compile(r'(?:^|;)\s*' + re.escape(featureType) + r'[\s=]+((?:"[^"]*"|[^;"])*)')
+
+def attributeValue(findAttribute, attributes):
+    '''Return the value found by an attributePattern regex in the attribute column, or None if the attribute is absent'''
+    if attributes.endswith("\n"):
+        attributes = attributes[:-1]
+    matches = findAttribute.findall(attributes)
+    if not matches:
+        return None
+    # as in HTSeq, a repeated attribute keeps its last value, and quotes are only stripped in pairs
+    value = matches[-1]
+    if value.startswith('"') and value.endswith('"'):
+        value = value[1:-1]
+    return value
+
+def skipContig(chrom):
+    '''
+    Nonstandard contigs (eg chr17_ctg5_hap1, chr19_gl000209_random, chrUn_...)
+    must be specifically excluded, otherwise you will end up with exception
+    ValueError: start is larger than end
+    due to duplicated gene symbols
+    '''
+    return "_hap" in chrom or "_random" in chrom or "chrUn_" in chrom
+
+def scanGffLines(lines, featureType, geneLoci=None, type_='exon'):
+    '''
+    Yield (chrom, start, end, strand, name) for every line of the given type on a standard contig.
+    start and end are 0-based, half open, like the HTSeq.GenomicInterval of the same line.
+    name is the value of attribute featureType; raises KeyError if a line does not have it.
+    If a geneLoci dictionary is given, the (start, end) of every 'gene' line, on any contig, is also recorded
+    as geneLoci[name][chrom], for union incompatible gene detection (see detect_union_bin_errors.py)
+    '''
+    findAttribute = attributePattern(featureType)
+    for line in lines:
+        if line.startswith('#') or line == "\n":
+            continue
+        cols = line.split("\t", 8)
+        if geneLoci is not None and cols[2] == 'gene':
+            name = attributeValue(findAttribute, cols[8])
+            if name is not None:
+                geneLoci[name].setdefault(cols[0], []).append( (int(cols[3]) - 1, int(cols[4])) )
+        # skip full transcripts, full genes, and other items that are not exon ranges
+        # including these lines will create '--union'-like behavior, regardless of whether the user passed the union option
+        if cols[2] != type_:
+            continue
+        if skipContig(cols[0]):
+            continue
+        name = attributeValue(findAttribute, cols[8])
+        if name is None:
+            raise KeyError(featureType)
+        yield cols[0], int(cols[3]) - 1, int(cols[4]), cols[6], name
+
+def openGff(gffFileName):
+    '''Open a plain or gzip compressed GFF/GTF file for reading'''
+    if gffFileName.lower().endswith(".gz"):
+        return gzip.open(gffFileName)
+    return open(gffFileName)
+
+def scanGff(gffFileName, featureType, geneLoci=None, type_='exon'):
+    '''Yield (chrom, start, end, strand, name) for every exon of the GFF/GTF file. See scanGffLines'''
+    gffFile = openGff(gffFileName)
+    try:
+        for record in scanGffLines(gffFile, featureType, geneLoci, type_):
+            yield record
+    finally:
+        gffFile.close()
+
+def splitGff(gffFileName, numChunks):
+    '''
+    Split a plain text GFF/GTF file into at most numChunks byte ranges [start, end) that begin and end on line boundaries
+    '''
+    size = os.path.getsize(gffFileName)
+    offsets = [0]
+    gffFile = open(gffFileName, 'rb')
+    for k in range(1, numChunks):
+        gffFile.seek(k * size // numChunks)
+        # move forward to the start of the next line
+        gffFile.readline()
+        offsets.append(min(gffFile.tell(), size))
+    gffFile.close()
+    offsets.append(size)
+    offsets = sorted(set(offsets))
+    return zip(offsets[:-1], offsets[1:])
+
+def scanGffRange(args):
+    '''
+    Worker for scanGffParallel: scan the lines of one byte range of the file.
+    Takes a single tuple (gffFileName, featureType, collectGenes, start, end) for use with multiprocessing.Pool.map
+    Returns the packed records, and the gene loci of the range as a dictionary if collectGenes is set
+    '''
+    gffFileName, featureType, collectGenes, start, end = args
+    gffFile = open(gffFileName, 'rb')
+    gffFile.seek(start)
+    chunk = gffFile.read(end - start)
+    gffFile.close()
+    geneLoci = None
+    if collectGenes:
+        geneLoci = defaultdict(dict)
+    packed = packRecords(scanGffLines(StringIO(chunk), featureType, geneLoci))
+    if geneLoci is not None:
+        geneLoci = dict(geneLoci)
+    return packed, geneLoci
+
+def packRecords(records):
+    '''
+    Pack records into columns, with contigs and names stored once and referenced by integer codes.
+    Exons of the same feature repeat contig and name, so this is much cheaper to send back from a worker than the record tuples
+    '''
+    contigCodes = {}
+    nameCodes = {}
+    columns = ([], [], array('l'), array('l'), [], array('l'))
+    for chrom, start, end, strand, name in records:
+        columns[0].append(contigCodes.setdefault(chrom, len(contigCodes)))
+        columns[2].append(start)
+        columns[3].append(end)
+        columns[4].append(strand)
+        columns[5].append(nameCodes.setdefault(name, len(nameCodes)))
+    contigs = sorted(contigCodes, key=contigCodes.get)
+    names = sorted(nameCodes, key=nameCodes.get)
+    return contigs, array('l', columns[0]), columns[2], columns[3], ''.join(columns[4]), names, columns[5]
+
+def unpackRecords(packed):
+    '''Yield the (chrom, start, end, strand, name) records of a chunk packed by packRecords'''
+    contigs, contigCodes, starts, ends, strands, names, nameCodes = packed
+    return itertools.izip([ contigs[x] for x in contigCodes ], starts, ends, strands, [ names[x] for x in nameCodes ])
+
+def scanGffParallel(gffFileName, featureType, workers, geneLoci=None):
+    '''
+    Scan the exons of the GFF/GTF file with a pool of worker processes, each parsing separate byte ranges of the file.
+    Returns the same records, in the same order, as scanGff, and fills geneLoci the same way.
+    Compressed files cannot be split at arbitrary offsets, and are scanned sequentially.
+    '''
+    if workers <= 1 or gffFileName.lower().endswith(".gz"):
+        return scanGff(gffFileName, featureType, geneLoci)
+    # several ranges per worker, so that one slow range does not hold up the rest
+    ranges = splitGff(gffFileName, workers * 4)
+    pool = multiprocessing.Pool(workers)
+    try:
+        chunks = pool.map(scanGffRange, [ (gffFileName, featureType, geneLoci is not None, start, end) for start, end in ranges ])
+    finally:
+        pool.close()
+        pool.join()
+    if geneLoci is not None:
+        # merge in file order, so each contig's list of copies is the same as from a sequential scan
+        for packed, chunkLoci in chunks:
+            for name, contigs in chunkLoci.items():
+                for contig, locs in contigs.items():
+                    geneLoci[name].setdefault(contig, []).extend(locs)
+    return itertools.chain.from_iterable( unpackRecords(packed) for packed, chunkLoci in chunks )
+
+def tabixIndexed(gffFileName):
+    '''Is the GFF/GTF file bgzipped and tabix indexed, and can the tabix or pysam module read it?'''
+    return ('tabix' in sys.modules or 'pysam' in sys.modules) and gffFileName.lower().endswith(".gz") and os.path.exists(gffFileName + ".tbi")
+
+def tabixContigs(gffFileName):
+    '''Return the contig names in the tabix index of the file, which lists them in the order they appear in the file'''
+    index = gzip.open(gffFileName + ".tbi")
+    try:
+        # magic, number of contigs, 6 format fields, and the length of the NUL separated contig names
+        fields = struct.unpack('<4s8i', index.read(36))
+        names = index.read(fields[8]).split('\0')[:fields[1]]
+    finally:
+        index.close()
+    return names
+
+class GffTabix(object):
+    '''Queries of a bgzipped, tabix indexed GFF/GTF file, through the tabix module, or pysam if it is not installed'''
+
+    def __init__(self, gffFileName):
+        if 'tabix' in sys.modules:
+            self.tb = tabix.open(gffFileName)
+            self.tbx = None
+        else:
+            self.tb = None
+            self.tbx = pysam.TabixFile(gffFileName)
+
+    def query(self, contig, start, end):
+        '''Return the lines, without line ends, of the records overlapping the 0-based, half open interval, in file order'''
+        if self.tb is not None:
+            try:
+                return [ "\t".join(row) for row in self.tb.query(contig, start, end) ]
+            except tabix.TabixError:
+                # no records on this contig
+                return []
+        try:
+            return list(self.tbx.fetch(contig, start, end))
+        except ValueError:
+            # no records on this contig
+            return []
+
+    def close(self):
+        if self.tbx is not None:
+            self.tbx.close()
+
+def queryRecords(gff, contig, start, end):
+    '''Return the records of the GFF/GTF overlapping the interval as (0-based start, end, line)'''
+    records = []
+    for line in gff.query(contig, start, end):
+        cols = line.split("\t", 5)
+        records.append( (int(cols[3]) - 1, int(cols[4]), line) )
+    return records
+
+def fetchGffLines(gffFileName, regions, expand=False):
+    '''
+    Yield the lines of a bgzipped, tabix indexed GFF/GTF file that overlap the regions, in file order, each line once.
+    regions is a dictionary of contig => list of 0-based, half open (start, end) intervals; None means the whole contig.
+    If expand is set, each region grows to cover every record found in it, until no record reaches outside it.
+    As the 'gene' line of a gene spans all of its exons, this fetches whole genes, which --union bins need.
+    '''
+    gff = GffTabix(gffFileName)
+    try:
+        for contig in tabixContigs(gffFileName):
+            if contig not in regions:
+                continue
+            intervals = regions[contig]
+            if intervals is None:
+                intervals = [ (0, TABIX_MAX_POSITION) ]
+            intervals = mergeIntervals(intervals)
+            # records of each interval, queried once; an expand round only queries the intervals that grew
+            fetched = {}
+            while True:
+                for interval in intervals:
+                    if interval not in fetched:
+                        fetched[interval] = queryRecords(gff, contig, interval[0], interval[1])
+                if not expand:
+                    break
+                reaching = [ (rowStart, rowEnd) for interval in intervals for rowStart, rowEnd, line in fetched[interval]
+                             if rowStart < interval[0] or rowEnd > interval[1] ]
+                if not reaching:
+                    break
+                intervals = mergeIntervals(intervals + reaching)
+                fetched = dict( (interval, fetched[interval]) for interval in intervals if interval in fetched )
+            # the intervals are sorted and disjoint, and each query returns its records in file order;
+            # a record of a later query that also overlaps an earlier one starts before the end of the one just before it,
+            # and was fetched by that query, so the records come out in file order, each once
+            previousEnd = None
+            for interval in intervals:
+                for rowStart, rowEnd, line in fetched[interval]:
+                    if previousEnd is None or rowStart >= previousEnd:
+                        yield line + "\n"
+                previousEnd = interval[1]
+    finally:
+        gff.close()
+
+def mergeIntervals(intervals):
+    '''Return the sorted list of disjoint (start, end) intervals covering the same positions as the given intervals'''
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append( (start, end) )
+    return merged
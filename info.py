@@ -33,11 +33,14 @@ class Info:
     usage = """
 Usage:
 {0} [-h] [-ex] -g GFF -f FEATURETYPE
+                       [-b <feature_type[:union]>]
                        [-db <dbName:/path/database.vcf.gz>] -s
                        <sample_list.txt> [-d <dirname>] [-vcff VCF_FILTERS]
-                       [-a ARCHIVE_DIRECTORY] [-r REGIONS] [-u] -jco
-                       JSON_CONFIG_OUTPUT -outd OUTPUT_DIRECTORY
-                       [-outt OUTPUT_TYPE]
+                       [-a ARCHIVE_DIRECTORY] [-rh] [-p PROCESSES] [-t THREADS]
+                       [-S <socket>] [-vr {htseq,pysam}] [-pc <dirname>]
+                       [-mb <MB>]
+                       [-r REGIONS] [-u] -jco JSON_CONFIG_OUTPUT
+                       -outd OUTPUT_DIRECTORY [-outt OUTPUT_TYPE]
 
 Flags:
   -h, --help            show this help message and exit
@@ -47,6 +50,11 @@ Flags:
                         Feature type into which to bin. Gencode GTF example:
                         gene_name, gene_id, transcript_name, transcript_id,
                         etc.
+  -b <feature_type[:union]>, --binning <feature_type[:union]>
+                        Additional feature type into which to bin in the same
+                        run, written to its own subdirectory of the output
+                        directory. Append ':union' to join its items as with
+                        -u. Can be declared >= 0 times.
   -db <dbName:/path/database.vcf.gz>, --database <dbName:/path/database.vcf.gz>
                         Colon delimited name and path to variant database in
                         bgzipped VCF format. Can be declared >= 0 times.
@@ -62,7 +70,39 @@ Flags:
   -a ARCHIVE_DIRECTORY, --archive_directory ARCHIVE_DIRECTORY
                         Specify directory in which to read/write archived
                         annotations. Undeclared will prevent using the
-                        annotation archive features.
+                        annotation archive features. The archive is selected
+                        by a digest of the GFF/GTF contents, recorded in the
+                        directory and reused while the file's size,
+                        modification and change times and inode are unchanged
+                        (see -rh).
+  -rh, --rehash_gff     Hash the GFF/GTF in every run to select its archive,
+                        rather than reusing the recorded digest. Use if the
+                        annotation may be edited without changing its size or
+                        timestamps.
+  -p PROCESSES, --processes PROCESSES
+                        Number of worker processes used to read the
+                        annotation and the variant files. Default: 1
+  -t THREADS, --threads THREADS
+                        Number of threads inflating each bgzipped VCF input
+                        file, in each worker process. Default: 1
+  -S <socket>, --server <socket>
+                        Unix socket of a running annotation server
+                        (annotationserver.py) holding the feature indexes and
+                        databases. Undeclared will load them in each run.
+  -vr {htseq,pysam}, --vcf_reader {htseq,pysam}
+                        Reader of VCF input files. pysam reads them with
+                        htslib, which is several times faster on large files.
+                        Default: htseq
+  -pc <dirname>, --parse_cache <dirname>
+                        Directory in which to cache the parsed variants of
+                        each input file. Later runs only parse the input
+                        files that are new or changed. Undeclared will parse
+                        every input file in every run.
+  -mb <MB>, --memory_budget <MB>
+                        Memory budget, in MB, of the variant rows. Rows
+                        beyond it are spilled to disk, and text outputs are
+                        written a part at a time; Excel outputs are skipped.
+                        Default: 0, no limit
   -r REGIONS, --regions REGIONS
                         Comma separated list of bed regions and/or bed files
                         by which to limit output. Ex:
@@ -75,8 +115,9 @@ Flags:
                         the same contig. When feature names are identical, the
                         bin will range from the beginning of the first
                         instance to the end of the last, even if they are
-                        several megabases apart. Refer to the documentation
-                        for a resolution using 'detect_union_bin_errors.py'
+                        several megabases apart. With a gene-centric feature
+                        type (e.g. gene_name), genes with separate copies on
+                        the same contig are detected and left out.
   -jco JSON_CONFIG_OUTPUT, --json_config_output JSON_CONFIG_OUTPUT
                         Name of JSON configuration output file
   -outd OUTPUT_DIRECTORY, --output_directory OUTPUT_DIRECTORY
@@ -20,13 +20,34 @@ from __future__ import print_function
 import HTSeq
 import sys
 import os
+from collections import OrderedDict
 from variant import Variant
+from variantcolumns import number
 import numpy as np
+import pandas as pd
 
 def throwWarning(message, help = False):
     print("*** WARNING: " + message + " ***")
     return
 
+# FORMAT keys read by the parse function of each source, and INFO keys read by parse_EFC and parse_INFO_Column.
+# Readers that decode values on demand (see vcfreader.py) decode only these; add to them when a parse function reads another key
+FORMAT_KEYS = { "MiSeq": ['VF', 'DP', 'AD'],
+                "IonTorrent": ['AO', 'RO', 'DP'],
+                "SomaticIndelDetector": ['DP', 'AD'],
+                "Mutect": ['DP', 'BQ', 'FA'],
+                "Samtools": ['DP4', 'DP'],
+                "VarScan": ['DP', 'FREQ'],
+                "HaplotypeCaller": ['DP', 'AD'],
+                "FreeBayes": ['DP', 'RO', 'AO'],
+                "GenericGATK": ['DP', 'VF', 'AD'],
+                "INFOCol": [] }
+INFO_KEYS = ['EFF', 'ANN', 'FC', 'EXON', 'VAF', 'VF', 'AF', 'DP', 'ADP']
+
+# sample columns from which a file is parsed by the column parse function of its source, rather than sample by sample;
+# the numpy arrays only pay off across many columns (FreeBayes: 3x slower at 1 sample, even at 8-32, 1.3-2x faster from 48)
+COLUMN_PARSE_MIN_SAMPLES = 64
+
 class Parser(object):
     '''Object to cover all parsing functions'''
 
@@ -53,21 +74,71 @@ class Parser(object):
                                         "GenericGATK":self.parse_GenericGATK,
                                         "INFOCol":self.parse_INFO_Column }
 
-    def parse(self, row, source):
+            # Column parse functions, for the sources that have one.
+            # These decode the FORMAT values of a row across all of its sample columns at once, into numpy arrays,
+            # and return the same depths and allele frequencies as the parse functions above, as floats; NaN where those return None
+            self.column_formats = { "IonTorrent":self.columns_IonTorrent,
+                                    "VarScan":self.columns_VarScan,
+                                    "HaplotypeCaller":self.columns_HapCaller,
+                                    "FreeBayes":self.columns_FreeBayes,
+                                    "GenericGATK":self.columns_GenericGATK }
+
+    def rowParser(self, source, sampleIds=None, fileSample=None, samples=None):
+        '''
+        Return a function parsing one VCF row of the given source (variant caller) into a list of Variant objects, one per sample.
+        The parse function of the source is looked up once, here, rather than for every row; raises KeyError if the source is not supported.
+        Given the sample columns of the file as sampleIds, the variants are named as the samples of the config:
+        the variant of a row with a single sample is assigned fileSample, the sample of the file in the config,
+        and those of a multi-sample row keep the names of their columns. If samples is given, only the variants of those samples are returned.
+        Files of at least COLUMN_PARSE_MIN_SAMPLES sample columns, of a source with a column parse function,
+        are parsed with it, decoding only the sample columns of those samples (see columnRowParser)
+        '''
+        parseSamples = self.supported_formats[source]
         self.source = source
-        self.row  = row
-        chrom = row.chrom 
-        ref   = row.ref
-        alt   = "/".join(sorted(row.alt))
-        pos   = row.pos # already exists as GenomicPosition object
-        dp    = 0
-        frac  = 0.0
-        effect, fc = parse_EFC(row.info)
-        out = []
-        samples_dict = self.supported_formats[self.source](row.samples)
-        for sample, vals in samples_dict.items():
-            out.append(Variant(source='', sample=sample, pos=pos, ref=ref, alt=alt, frac=vals[1], dp=vals[0], eff=effect, fc=fc))
-        return out
+        if samples is not None:
+            samples = set(samples)
+        if sampleIds and len(sampleIds) >= COLUMN_PARSE_MIN_SAMPLES and source in self.column_formats:
+            return self.columnRowParser(source, sampleIds, fileSample, samples)
+        # a single-sample file is one of a single sample column; without the columns, one whose rows parse to a single sample
+        singleSample = len(sampleIds) == 1 if sampleIds else None
+        def parseRow(row):
+            self.row = row
+            alt = "/".join(sorted(row.alt))
+            pos = row.pos # already exists as GenomicPosition object
+            effect, fc = parse_EFC(row.info)
+            parsed = parseSamples(row.samples)
+            if fileSample is not None and (singleSample if singleSample is not None else len(parsed) == 1):
+                # not a multi-sample row; the sample is that of the file
+                parsed = { fileSample: parsed.values()[0] }
+            return [ Variant('', sample, pos, row.ref, alt, vals[1], vals[0], effect, fc) for sample, vals in parsed.items() if samples is None or sample in samples ]
+        return parseRow
+
+    def columnRowParser(self, source, sampleIds, fileSample, samples):
+        '''
+        rowParser of a source with a column parse function. The sample of each column, and the columns of the samples of interest,
+        are found once for the file; rows then yield one variant per column of interest, in column order
+        '''
+        parseColumns = self.column_formats[source]
+        keys = FORMAT_KEYS[source]
+        if len(sampleIds) == 1:
+            columnSamples = [ fileSample ]
+        else:
+            columnSamples = sampleIds
+        columns = [ i for i, sample in enumerate(columnSamples) if samples is None or sample in samples ]
+        names = [ columnSamples[i] for i in columns ]
+        def parseRow(row):
+            self.row = row
+            if not columns:
+                return []
+            alt = "/".join(sorted(row.alt))
+            pos = row.pos # already exists as GenomicPosition object
+            effect, fc = parse_EFC(row.info)
+            dp, vf = parseColumns(row.formatColumns(keys, columns))
+            return [ Variant('', sample, pos, row.ref, alt, frac, depth, effect, fc) for sample, depth, frac in zip(names, dp.tolist(), vf.tolist()) ]
+        return parseRow
+
+    def parse(self, row, source):
+        return self.rowParser(source)(row)
 
     def parse_MiSeq(self,samples):
         ''' MiSeq vcf parser function. Input: InputParser object. Output: Variant object '''
@@ -114,23 +185,22 @@ class Parser(object):
             out[sample] = (dp, vf) 
         return out
 
+    def columns_IonTorrent(self, columns):
+        ''' Ion Torrent column parser, as parse_IonTorrent. Input: FORMAT values of each key across sample columns. Output: depth and allele frequency arrays '''
+        ao = listColumn(columns['AO'])[2]
+        ro = numberColumn(columns['RO'])
+        dp = numberColumn(columns['DP'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vf = ao / dp
+        missing = np.isnan(ao) | np.isnan(ro) | np.isnan(dp)
+        dp[missing] = np.nan
+        vf[missing | (dp == 0)] = np.nan
+        return dp, vf
+
     def parse_MuTectOUT(self):
         ''' MuTect '.out' parser function. Input: InputParser object. Output: Variant object '''
-
-        row = self.row
-        fieldId = self.fieldId
-        header = self.header
-        fn = self.fn 
-        chrom = row[0]
-        ref   = row[3]
-        alt   = row[4]
-        effect = ""
-        fc = ""
-        vf = float(row[fieldId['tumor_f']])
-        dp = int(int(str(row[fieldId['t_ref_count']]).strip()) + int(str(row[fieldId['t_alt_count']]).strip()))
-        position = int(row[fieldId['position']])
-
-        var = Variant(source=os.path.basename(fn), sample='', pos=HTSeq.GenomicPosition(chrom, int(position)), ref=ref, alt=alt, frac=vf, dp=dp, eff=effect.strip(';'), fc=fc.strip(';'))
+        chrom, position, ref, alt, vf, dp = muTectOutFields(self.fieldId)(self.row)
+        var = Variant(source=os.path.basename(self.fn), sample='', pos=(chrom, position), ref=ref, alt=alt, frac=vf, dp=dp, eff='', fc='')
         return var
         
     def parse_MuTectVCF(self, samples):
@@ -229,6 +299,13 @@ class Parser(object):
             out[sample] = (dp, vf) 
         return out
 
+    def columns_VarScan(self, columns):
+        ''' varscan column parser, as parse_VarScan. Input: FORMAT values of each key across sample columns. Output: depth and allele frequency arrays '''
+        dp = numberColumn(columns['DP'])
+        vf = numberColumn([ x.strip('%') if x is not None else None for x in columns['FREQ'] ]) / 100.0
+        vf[np.isnan(dp)] = np.nan
+        return dp, vf
+
     def parse_HapCaller(self, samples):
         ''' GATK haplotype caller vcf parser function. Input: InputParser object. Output: Variant object '''
         out = {} # list of variant objects; 1 per sample
@@ -251,6 +328,17 @@ class Parser(object):
             out[sample] = (dp, vf)
         return out
 
+    def columns_HapCaller(self, columns):
+        ''' GATK haplotype caller column parser, as parse_HapCaller. Input: FORMAT values of each key across sample columns. Output: depth and allele frequency arrays '''
+        dp = numberColumn(columns['DP'])
+        ref_count, alt_count, total = listColumn(columns['AD'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vf = alt_count / (ref_count + alt_count)
+        # This was called, but is not covered
+        vf[(dp == 0) & (ref_count == 0) & (alt_count == 0)] = 0.0
+        vf[np.isnan(dp)] = np.nan
+        return dp, vf
+
     def parse_FreeBayes(self, samples):
         ''' freebayes vcf parser function. Input: InputParser object. Output: Variant object '''
         out = {} # list of variant objects; 1 per sample
@@ -267,6 +355,16 @@ class Parser(object):
             out[sample] = (dp, vf) 
         return out
 
+    def columns_FreeBayes(self, columns):
+        ''' freebayes column parser, as parse_FreeBayes. Input: FORMAT values of each key across sample columns. Output: depth and allele frequency arrays '''
+        dp = numberColumn(columns['DP'])
+        ro = numberColumn(columns['RO'])
+        ao = listColumn(columns['AO'])[2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vf = ao / (ao + ro)
+        vf[np.isnan(dp)] = np.nan
+        return dp, vf
+
     def parse_GenericGATK(self, samples):
         ''' 
         Generic GATK parser function. This was written for the Illumina BaseSpace BWA Enrichment Workflow vcf files, but may apply to more filetypes
@@ -305,6 +403,19 @@ class Parser(object):
             out[sample] = (dp, vf) 
         return out
 
+    def columns_GenericGATK(self, columns):
+        ''' Generic GATK column parser, as parse_GenericGATK. Input: FORMAT values of each key across sample columns. Output: depth and allele frequency arrays '''
+        dp = numberColumn(columns['DP'])
+        vf = numberColumn(columns['VF'])
+        ro, second, total = listColumn(columns['AD'])
+        ao = total - ro
+        # without DP, depth and VAF are determined from the 'AD' field, if present and not all 0
+        fromAD = np.isnan(dp) & ~np.isnan(ro) & ((ro != 0) | (ao != 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dp[fromAD] = (ro + ao)[fromAD]
+            vf[fromAD] = ao[fromAD] / dp[fromAD]
+        return dp, vf
+
     def parse_INFO_Column(self, samples):
         '''
         Generic VCF parser which extracts allele frequency and depth from the INFO field, rather than the SAMPLE field associated with a specific sample. May be useful for cases in which aggregate VAF and DP are more interesting than per-sample metrics, or when aggregate values are available and per-sample values are not.
@@ -347,6 +458,89 @@ class Parser(object):
         var = Variant(source=os.path.basename(fn), pos=HTSeq.GenomicPosition(chrom, int(position)), ref=ref, alt=alt, frac=vf, dp=dp, eff=effect.strip(';'), fc=fc.strip(';'))
         return var
 
+def muTectOutFields(fieldId):
+    '''
+    Return a function reading a row of a MuTect '.out' file, whose header columns are numbered by fieldId,
+    into the tuple (chrom, position, ref, alt, vf, dp).
+    Columns are looked up once, here, so the rows of a file can be read and filtered without building a Variant for each
+    '''
+    tumor_f = fieldId['tumor_f']
+    t_ref_count = fieldId['t_ref_count']
+    t_alt_count = fieldId['t_alt_count']
+    position = fieldId['position']
+    def fields(row):
+        return row[0], int(row[position]), row[3], row[4], float(row[tumor_f]), int(row[t_ref_count].strip()) + int(row[t_alt_count].strip())
+    return fields
+
+# rows of a MuTect '.out' file read at a time by muTectOutChunks
+MUTECT_OUT_CHUNK_ROWS = 100000
+
+def muTectOutChunks(varFile, filters, regionIndex=None, chunkRows=MUTECT_OUT_CHUNK_ROWS):
+    '''
+    Read a MuTect '.out' file, open at its start, in chunks of chunkRows rows, each parsed into typed columns at once.
+    The judgement filter, and the regions of a RegionIndex if given, are applied to whole columns:
+    a row is kept if all of its judgements are allowed filters, as mucor.filterRow has it.
+    Yields the kept rows of each chunk as the lists (chroms, positions, refs, alts, vfs, dps), with the values muTectOutFields reads
+    '''
+    line = varFile.readline()
+    while line.startswith('##'):
+        line = varFile.readline()
+    if not line.strip(): raise ValueError('Invalid header')
+    header = line.rstrip("\r\n").split("\t")
+    fieldId = dict(zip(header, range(0, len(header))))
+    position, tumor_f, t_ref_count, t_alt_count, judgement = [ fieldId[x] for x in ['position', 'tumor_f', 't_ref_count', 't_alt_count', 'judgement'] ]
+    textColumns = dict( (column, str) for column in [0, 3, 4, judgement] )
+    # text is kept as is, and numbers are parsed to the same value as float() and int() give
+    try:
+        chunks = pd.read_csv(varFile, sep="\t", header=None, usecols=sorted(set([0, position, 3, 4, tumor_f, t_ref_count, t_alt_count, judgement])),
+                             dtype=textColumns, na_filter=False, float_precision='round_trip', chunksize=chunkRows)
+    except pd.errors.EmptyDataError:
+        # a header without rows: no variants
+        return
+    allowed = {}    # judgement => are all its filters allowed?
+    for chunk in chunks:
+        for value in chunk[judgement].unique():
+            if value not in allowed:
+                allowed[value] = all( x in filters for x in str(value).split(';') )
+        rows = chunk[judgement].isin([ value for value in allowed if allowed[value] ]).values
+        chroms = chunk[0].values[rows]
+        positions = chunk[position].values[rows].astype(np.int64)
+        if regionIndex is not None:
+            inRegions = regionIndex.containsMany(chroms, positions)
+            rows[rows] = inRegions
+            chroms = chroms[inRegions]
+            positions = positions[inRegions]
+        dps = chunk[t_ref_count].values[rows].astype(np.int64) + chunk[t_alt_count].values[rows].astype(np.int64)
+        yield ( chroms.tolist(), positions.tolist(), chunk[3].values[rows].tolist(), chunk[4].values[rows].tolist(),
+                chunk[tumor_f].values[rows].astype(float).tolist(), dps.tolist() )
+
+def numberColumn(values):
+    '''
+    Return the values of a FORMAT key across sample columns, given as text, as a float array.
+    Missing values (None, empty or '.') and values that are not numbers are NaN
+    '''
+    values = [ x if x not in (None, '', '.') else 'nan' for x in values ]
+    try:
+        return np.array(values, dtype=float)
+    except ValueError:
+        return np.array([ number(x) for x in values ], dtype=float)
+
+def listColumn(values):
+    '''
+    Return the values of a FORMAT key holding a comma separated list of numbers per sample column, such as AD or AO,
+    as three float arrays: the first number of each column, the second number, and the sum of all its numbers. NaN where missing
+    '''
+    lists = [ x.split(',') if x not in (None, '', '.') else ['nan'] for x in values ]
+    lengths = np.array([ len(x) for x in lists ], dtype=int)
+    numbers = numberColumn([ x for numbers in lists for x in numbers ])
+    if not len(lists):
+        return numbers, numbers, numbers
+    starts = np.cumsum(lengths) - lengths
+    first = numbers[starts]
+    second = np.full(len(lists), np.nan)
+    second[lengths > 1] = numbers[starts[lengths > 1] + 1]
+    return first, second, np.add.reduceat(numbers, starts)
+
 def castList(list_or_string):
     '''
     Input: a string or a list 
@@ -363,24 +557,100 @@ def parse_EFC(INFO):
     fc = ""     # e.g. SYNONYMOUS_CODING
     # check for snpeff annotation first
     if 'EFF' in INFO:
-        castList(INFO['EFF'])
-        fc = ";".join([x for x in set([ x.split('(')[0] for x in castList(INFO['EFF']) ])])
-        effect = ";".join([x for x in set([ x.split('|')[3] for x in castList(INFO['EFF']) if x.split('|')[3] ])])
+        effect, fc = annotationEFC('EFF', INFO['EFF'])
     # check for newer type of snpeff notation
     elif 'ANN' in INFO:
-        castList(INFO['ANN'])
-        fc = ";".join([x for x in set([ x.split('|')[1] for x in castList(INFO['ANN']) ])])
-        effect = ";".join([x for x in set([ x.split('|')[9] for x in castList(INFO['ANN']) ])])
+        effect, fc = annotationEFC('ANN', INFO['ANN'])
     # if the MiSeq software reported functional consequence and effect and the file is not snpEff anotated, the MiSeq annotations will be used instead
     elif 'FC' in INFO:
-        fc  = ";".join([x for x in set( [y.split('_')[0] for y in castList(INFO['FC'])] )])
-        try:
-            effect = ";".join([x for x in set( [y.split('_')[1] for y in castList(INFO['FC'])] )])
-        except IndexError:
-            # this mutation has no consequence
-            # i.e. Silent, Noncoding, etc. 
-            pass
+        effect, fc = annotationEFC('FC', INFO['FC'])
         if 'EXON' in INFO:
             fc += ";EXON"
 
-    return effect, fc
\ No newline at end of file
+    return effect, fc
+
+class LRUCache(object):
+    '''
+    Mapping of at most maxsize items. Items are kept in order of use, least recent first,
+    so a lookup moves its item to the end and adding to a full cache drops the first item
+    '''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        '''Return the value of key, marking it as the most recently used, or None if it is not cached'''
+        value = self.items.pop(key, None)
+        if value is not None:
+            self.items[key] = value
+        return value
+
+    def add(self, key, value):
+        '''Cache value as that of key, dropping the least recently used item if the cache is full'''
+        self.items.pop(key, None)
+        self.items[key] = value
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+# (effect, fc) of the annotation values read last, by annotation key and raw value;
+# the same annotation strings recur at recurrent sites across the samples and files of a project
+ANNOTATION_CACHE_SIZE = 65536
+annotationCache = LRUCache(ANNOTATION_CACHE_SIZE)
+
+def annotationEFC(key, value):
+    '''
+    Return (effect, fc) of the value of the annotation key ('EFF', 'ANN' or 'FC') of an INFO field, as parse_EFC does.
+    Results are cached by the raw value; a value that does not parse raises as it would uncached
+    '''
+    entries = tuple(castList(value))
+    cached = annotationCache.get( (key, entries) )
+    if cached is None:
+        cached = ANNOTATION_PARSERS[key](entries)
+        annotationCache.add( (key, entries), cached )
+    return cached
+
+def effectsEFF(entries):
+    '''(effect, fc) of snpEff 'EFF' entries, e.g. NON_SYNONYMOUS_CODING(MODERATE|MISSENSE|Gcc/Tcc|A12S|...), reading each entry in one pass'''
+    fcs = []
+    effects = []
+    for x in entries:
+        fields = x.split('|')
+        fcs.append(x.partition('(')[0])
+        if fields[3]:
+            effects.append(fields[3])
+    return ";".join(set(effects)), ";".join(set(fcs))
+
+def effectsANN(entries):
+    '''(effect, fc) of snpEff 'ANN' entries, e.g. T|missense_variant|MODERATE|GENE1|..., reading each entry in one pass'''
+    fcs = []
+    effects = []
+    for x in entries:
+        fields = x.split('|')
+        fcs.append(fields[1])
+        effects.append(fields[9])
+    return ";".join(set(effects)), ";".join(set(fcs))
+
+def effectsFC(entries):
+    '''(effect, fc) of MiSeq 'FC' entries, e.g. Missense_A12S; the effect is left empty if any entry has none'''
+    fcs = []
+    effects = []
+    for y in entries:
+        fields = y.split('_')
+        fcs.append(fields[0])
+        if len(fields) > 1 and effects is not None:
+            effects.append(fields[1])
+        else:
+            # this mutation has no consequence
+            # i.e. Silent, Noncoding, etc.
+            effects = None
+    if effects is None:
+        return "", ";".join(set(fcs))
+    return ";".join(set(effects)), ";".join(set(fcs))
+
+ANNOTATION_PARSERS = { 'EFF': effectsEFF,
+                       'ANN': effectsANN,
+                       'FC': effectsFC }
@@ -30,11 +30,14 @@ import os
 import sys
 import time
 import argparse
-import csv
 import itertools
+import copy
+import shutil
+import tempfile
+import multiprocessing
+from collections import OrderedDict
 from collections import defaultdict
 import gzip
-import cPickle as pickle
 import json
 
 # nonstandard, required modules
@@ -75,7 +78,15 @@ except ImportError:
 # mucor modules
 import mucorfilters as mf
 from variant import Variant
+from variantcolumns import VariantColumns, CODED_COLUMNS, ROW_BYTES
+from regionindex import RegionIndex
 from mucorfeature import MucorFeature
+import featureindex
+import gffreader
+import vcfreader
+import parsecache
+import detect_union_bin_errors
+import annotationserver
 import inputs
 import output
 from config import Config
@@ -90,69 +101,108 @@ def throwWarning(message, help = False):
     print("*** WARNING: " + message + " ***")
     return
 
-def constructGAS(gffFile, featureType, knownFeatures, duplicateFeatures, union):
-    gas = HTSeq.GenomicArrayOfSets("auto", stranded=False)
-    for feature in itertools.islice(gffFile, 0, None):
-        # Nonstandard contigs (eg chr17_ctg5_hap1, chr19_gl000209_random, chrUn_...)
-        # must be specifically excluded, otherwise you will end up with exception
-        # ValueError: start is larger than end
-        # due to duplicated gene symbols
-        if "_hap" in feature.iv.chrom:
-            continue
-        elif "_random" in feature.iv.chrom:
-            continue
-        elif "chrUn_" in feature.iv.chrom:
-            continue
-
-        # skip full transcripts, full genes, and other items that are not exon ranges
-        # including these lines will create '--union'-like behavior, regardless of whether the user passed the union option
-        if feature.type != 'exon':
-            continue
-
-        # transform feature to instance of Class MucorFeature
-        feat = MucorFeature(feature.attr[featureType], feature.type, feature.iv)
-        
+def binFeatures(records, union):
+    '''
+    Turn exon records (chrom, start, end, strand, name) from gffreader into feature bins.
+    Returns the list of (chrom, start, end, name) bin intervals, in GFF order,
+    a dictionary of feature name => (chrom, start, end, strand) of its last bin, and the set of duplicate feature names
+    '''
+    intervals = []
+    features = {}
+    duplicateFeatures = set()
+    for chrom, start, end, strand, name in records:
         # WARNING
         # the following REQUIRES a coordinate-sorted GFF/GTF file
         # extra checks incurring slowdown penalty are req'd if GFF/GTF not sorted
 
-        if feat.name in knownFeatures:
+        if name in features:
             # In case there is an error in the GFF and/or the featureType (-f) is not unique,
             # issue a warning
             # for example, genes.gtf supplied with the Illumina igenomes package for the tuxedo tools suite
             # includes duplicate entries for many genes -- e.g. DDX11L1 on chr15 shoudl be DDX11L9
             # try to cope with this by relabeling subsequent genes as GENESYM.chrNN
-            if feat.iv.chrom != knownFeatures[feat.name].iv.chrom:
-                duplicateFeatures.add(feat.name)
-                feat.name = feat.name + '.' + feat.iv.chrom
+            if chrom != features[name][0]:
+                duplicateFeatures.add(name)
+                name = name + '.' + chrom
             else:
                 if union:
                     # replace the start and end coordinates when adding SUCCESSIVE bits of a feature (e.g. exons)
                     # results in one, large feature, starting with the earliest upsream location and ending with the latest downstream location
-                    if knownFeatures[feat.name].iv.start < feat.iv.start:
-                        feat.iv.start = knownFeatures[feat.name].iv.start
-                    if knownFeatures[feat.name].iv.end > feat.iv.end:
-                        feat.iv.end = knownFeatures[feat.name].iv.end
+                    if features[name][1] < start:
+                        start = features[name][1]
+                    if features[name][2] > end:
+                        end = features[name][2]
                 else:
                     pass # no-union - this does overwrite previous coordinates in knownFeatures,
-                         # but should not matter as the actual coordinates are obtaind from 'gas'.
+                         # but should not matter as the actual coordinates are obtaind from the feature index.
                          # Locations held in knownFeatures should not be used to identify the start and stop of a feature,
                          # since these locations will only reveal the last known region for the feature. 
                          # Later in the program, querying knownFeatures for the variants in a feature (ie: skipThisIndel function)
                          # may return variants that appear to be located in positions outside of the feature region reported by knownFeatures. 
                          # This is also caused by the 'no-union' overwrite, since the knownFeature region locations do not represent the whole feature.
 
-        # first, add to the knownFeatures, a dictionary of MucorFeatures, which contain the variants set
-        knownFeatures[feat.name] = feat
-        # then, add to the GenomicArrayOfSets, which we use to find gene symbol from variant coords
-        try:
-            gas[ feat.iv ] += feat.name
-        except ValueError:
-            print(feat.name)
-            print(feat.iv)
-            raise
-    
-    return gas, knownFeatures, duplicateFeatures
+        # first, record the feature, which becomes a MucorFeature in knownFeatures
+        features[name] = (chrom, start, end, strand)
+        # then, add to the feature bins, which we use to find gene symbol from variant coords
+        intervals.append( (chrom, start, end, name) )
+
+    return intervals, features, duplicateFeatures
+
+def constructFeatureIndex(gffFileName, featureType, union, workers=1, regions=None):
+    '''
+    Scan the exons of the GFF/GTF file and build the feature index.
+    With more than one worker, the file is scanned in parallel byte ranges; the records come back in file order,
+    so relabeling duplicates and --union coalescing below give the same bins as a sequential scan.
+    With union and a gene-centric feature type, genes with separate copies on the same contig
+    would get one huge bin spanning all of them, so they are found from the 'gene' lines of the same scan
+    (as detect_union_bin_errors.py does) and left out of the index.
+    If regions (see gffRegions) are given and the GFF/GTF is bgzipped and tabix indexed, only the records overlapping them are read.
+    Features in the regions then get the same names and bins as from a whole-file scan, as long as each one's duplicates are fetched too:
+    a name is relabeled by the contig it first occurs on, and union incompatible genes are found from their copies,
+    so a feature whose first contig, or another copy on its contig, lies outside the regions is named or binned as if it had none.
+    Knowing those would take a scan of the whole file, which is what reading through the index avoids.
+    Returns tuple (FeatureIndex, knownFeatures, duplicateFeatures)
+    '''
+    geneLoci = None
+    if union and "gene" in featureType:
+        geneLoci = defaultdict(dict)
+    if regions is not None and gffreader.tabixIndexed(gffFileName):
+        print("Reading annotation records overlapping the regions of {0} contigs through the tabix index".format(len(regions)))
+        # union bins need every exon of a gene, not only those overlapping the regions
+        records = gffreader.scanGffLines(gffreader.fetchGffLines(gffFileName, regions, expand=union), featureType, geneLoci)
+    else:
+        records = gffreader.scanGffParallel(gffFileName, featureType, workers, geneLoci)
+    intervals, features, duplicateFeatures = binFeatures(records, union)
+    unionIncompatible = []
+    if geneLoci is not None:
+        # the scan is finished, so geneLoci is complete
+        unionIncompatible = detect_union_bin_errors.ProblemNames(detect_union_bin_errors.FindProblems(geneLoci))
+    featureIndex = featureindex.FeatureIndex.fromIntervals(intervals, features, duplicateFeatures, unionIncompatible)
+    return featureIndex, featureIndex.knownFeatures(), duplicateFeatures
+
+def loadOrBuildArchive(gffFileName, featureType, fast, union, workers=1, fingerprintMemo=True):
+    '''
+    Open the annotation archive in directory fast for this GFF/GTF, feature type and union setting,
+    building and saving it first if there is none.
+    The archive is selected by the digest of the GFF/GTF, recorded in the archive directory unless fingerprintMemo is unset
+    (see featureindex.cachedGffFingerprint).
+    Returns tuple (FeatureIndex, archive path, whether the archive was built by this call)
+    '''
+    archiveMeta = featureindex.archiveMeta(featureindex.cachedGffFingerprint(fast, gffFileName, fingerprintMemo), featureType, union)
+    archiveFilePath = featureindex.archivePath(fast, gffFileName, featureType, union, archiveMeta['gffFingerprint'])
+    featureIndex = featureindex.loadArchive(archiveFilePath, archiveMeta)
+    if featureIndex:
+        # using the existing annotation archive
+        print("Opening annotation archive: " + str(archiveFilePath))
+        return featureIndex, archiveFilePath, False
+    # no archive exists for this combination of gff contents and feature; creating it in the directory provided to the 'fast' option
+    print("Cannot locate annotation archive for " + os.path.basename(gffFileName) + str(" w/ ") + str(featureType) + " and --union=" + str(union) )
+    print("   Reading in annotation and saving archive for faster future runs") 
+    featureIndex, knownFeatures, duplicateFeatures = constructFeatureIndex(gffFileName, featureType, union, workers)
+    if not featureindex.saveArchive(featureIndex, archiveFilePath, archiveMeta):
+        print("   Annotation archive was written concurrently by another run; keeping theirs")
+        return featureIndex, archiveFilePath, False
+    return featureIndex, archiveFilePath, True
 
 def parseJSON(json_config):
     '''
@@ -170,13 +220,42 @@ def parseJSON(json_config):
     config.featureType = JD['feature']
     config.outputDir = os.path.expanduser(JD['outputDir'])
     config.union = JD['union']
+    # the feature type and union setting above is the primary binning, written to outputDir
+    # further binnings are read from the same parse of the input files, and each written to its own subdirectory
+    config.binnings = [ (config.featureType, config.union) ]
+    for binning in JD.get('binnings', []):
+        featureType, union = str(binning['feature']), bool(binning['union'])
+        if (featureType, union) not in config.binnings:
+            config.binnings.append( (featureType, union) )
     config.fast = JD['fast']
+    # reuse the digest of the GFF/GTF recorded in the archive directory while the file is unchanged, or hash it in every run
+    config.fingerprintMemo = bool(JD.get('fingerprintMemo', True))
     config.gff = JD['gff']
+    # number of worker processes; configs written before this option existed run single-process
+    config.workers = max(1, int(JD.get('workers', 1)))
+    # number of threads inflating each bgzipped VCF input file, in each worker process
+    config.threads = max(1, int(JD.get('threads', 1)))
+    # Unix socket of a running annotation server, which holds the feature indexes and database handles; empty to load them in this run
+    config.server = JD.get('server', '')
+    # reader of VCF input files; see vcfreader.py
+    config.vcfReader = str(JD.get('vcfReader', 'htseq'))
+    if config.vcfReader not in vcfreader.READERS:
+        abortWithMessage("Unknown VCF reader '{0}'. Options include: {1}".format(config.vcfReader, ", ".join(vcfreader.READERS)))
+    if not vcfreader.readerAvailable(config.vcfReader):
+        throwWarning("{0} module not found; reading VCF files with HTSeq".format(config.vcfReader))
+        config.vcfReader = "htseq"
+    # directory of the parse cache (see parsecache.py); empty to parse every input file in every run
+    config.parseCache = os.path.expanduser(str(JD.get('parseCache', '')))
+    # memory budget, in MB, of the variant rows; above it, rows are spilled to disk and written out in partitions. 0 holds all rows in memory
+    config.memoryBudget = max(0, int(JD.get('memoryBudget', 0)))
     config.outputFormats = list(set(JD['outputFormats'])) # 'set' prevents repeated formats from being written multiple times
     if JD['databases']:
         if 'tabix' in sys.modules: # make sure tabix is imported 
             for name,db in JD['databases'].items():
-                dbPointer = checkAndOpen(db)
+                if config.server:
+                    dbPointer = annotationserver.connect(config.server).database(db)
+                else:
+                    dbPointer = checkAndOpen(db)
                 if dbPointer:
                     #check for non-null pointers
                     config.databases[name] = dbPointer
@@ -204,10 +283,13 @@ def parseJSON(json_config):
 
     return config 
 
-def parseGffFile(gffFileName, featureType, fast, union):
+def parseGffFile(gffFileName, featureType, fast, union, workers=1, server='', regions=None, fingerprintMemo=True):
     '''
-    Parse the GFF/GTF file. Return tuple (knownFeatures, GenomicArrayOfSets)
+    Parse the GFF/GTF file. Return tuple (knownFeatures, FeatureIndex)
     Haplotype contigs are explicitly excluded because of a coordinate crash (begin > end)
+    If the Unix socket of an annotation server is given, the feature index is the one held by the server (see annotationserver.py)
+    Without an archive or server, the annotation can be restricted to regions (see constructFeatureIndex);
+    archives always hold the whole annotation, so that any later run can use them.
     '''
     
     # TO DO: command line flag should indicate that variants in INTRONS are counted
@@ -215,106 +297,91 @@ def parseGffFile(gffFileName, featureType, fast, union):
     
     startTime = time.clock()
     print("\n=== Reading GFF/GTF file {0} ===".format(gffFileName))
-    
-    if union:
-        unionstatus = str("union")
-    else:
-        unionstatus = str("no_union")
-    annotFileName = os.path.splitext(os.path.basename(gffFileName))[0]
-    # pickled file is created for specific combinations of gff annotation and feature type. See below for more details. **
-
-    archiveFilePath = os.path.expanduser(fast) + str("/") + str(annotFileName) + str('_') + str(featureType) + str("_") + unionstatus + str('.p')
     print(gffFileName)
-    gffFile = HTSeq.GFF_Reader(gffFileName)
-    
-    knownFeatures = {}
 
-    duplicateFeatures = set()
-
-    # gas - GenomicArrayOfSets.
-    # typecode always 'O' (object) for GenomicArrayOfSets
+    # featureIndex - sorted, array-backed feature bins (see featureindex.py)
     # UNstranded -- VCF and muTect output always report on + strand,
-    # but the GenomicArray must be unstranded because the GFF /is/ strand-specific,
+    # but the index must be unstranded because the GFF /is/ strand-specific,
     # and if I manually coded all GenomicIntervals read from the VCF or muTect file as '+',
     # then no genes on the - strand would have variants binned to them
 
-    # Fast boolean determines whether the user wants to load a pickle file annotation that they made in a previous run
-    # The pickle file will load the genomic array of sets, known features, and duplicate features. 
-    # ** These three items will change depending on the supplied gff annotation AND the feature selected AND whether union was used. 
-    #    Thus, each pickle file will be for a specific combination of gff, feature, and union status, hence the naming convention.
-    if bool(fast):
-        # user wants to use pickled annotations
-        if os.path.exists( archiveFilePath ):
-            # using the existing, pickled annotation
-            print("Opening annotation archive: " + str(archiveFilePath))
-            pAnnot = open(archiveFilePath, 'rb')
-            gas = pickle.load(pAnnot)
-            knownFeatures = pickle.load(pAnnot)
-            duplicateFeatures = pickle.load(pAnnot)
-            pAnnot.close()
-        else:
-            # no pickled annotation exists for this combination of gff and feature; creating it in the directory provided to the 'fast' option
-            print("Cannot locate annotation archive for " + os.path.basename(gffFileName) + str(" w/ ") + str(featureType) + " and --union=" + str(union) )
-            print("   Reading in annotation and saving archive for faster future runs") 
-            if not os.path.exists( str("/".join(archiveFilePath.split('/')[:-1])) ):
-                os.makedirs( str("/".join(archiveFilePath.split('/')[:-1])) )
-            gas, knownFeatures, duplicateFeatures = constructGAS(gffFile, featureType, knownFeatures, duplicateFeatures, union)
-            archiveOut = open(archiveFilePath, 'wb')
-            pickle.dump(gas, archiveOut, -1)
-            pickle.dump(knownFeatures, archiveOut, -1)
-            pickle.dump(duplicateFeatures, archiveOut, -1)
-            archiveOut.close()
-    if not bool(fast):
-    # ignore pickles function entirely. Won't check for it and won't attempt to create it
-        gas, knownFeatures, duplicateFeatures = constructGAS(gffFile, featureType, knownFeatures, duplicateFeatures, union)
+    # Fast determines whether the user wants to load an annotation archive that they made in a previous run
+    # The archive holds the feature bins, known features, and duplicate features, as memory-mappable numpy arrays.
+    # Bins are partitioned by contig, and a partition is only read on the first variant lookup on its contig,
+    # so runs restricted to a few regions, or to a targeted panel, only touch the contigs they have variants on.
+    # ** These items will change depending on the supplied gff annotation AND the feature selected AND whether union was used. 
+    #    Thus, each archive is keyed by a fingerprint of the gff contents, the feature, and the union status.
+    #    Editing the gff in place therefore results in a new archive, rather than silently reusing stale bins.
+    if server:
+        # the server loads (or builds) the index once and keeps it for every run; lookups are sent over the socket
+        featureIndex = annotationserver.connect(server).featureIndex(gffFileName, featureType, fast, union, workers, fingerprintMemo)
+        print("Using feature index held by annotation server: " + str(server))
+        knownFeatures = featureIndex.knownFeatures()
+        duplicateFeatures = featureIndex.duplicateFeatures
+    elif bool(fast):
+        # user wants to use archived annotations
+        featureIndex, archiveFilePath, built = loadOrBuildArchive(gffFileName, featureType, fast, union, workers, fingerprintMemo)
+        knownFeatures = featureIndex.knownFeatures()
+        duplicateFeatures = featureIndex.duplicateFeatures
+    else:
+    # ignore archive function entirely. Won't check for it and won't attempt to create it
+        featureIndex, knownFeatures, duplicateFeatures = constructFeatureIndex(gffFileName, featureType, union, workers, regions)
 
     if duplicateFeatures:
         print("*** WARNING: {0} {1}s found on more than one contig".format(len(duplicateFeatures), featureType))
-    # remove gene-centric feature names that are known to have problematic bins caused by multiple copies on the same gene
-    # run the accompanying 'detect union bin errors' python script to generate a list of incompatible genes
-    if union and "gene" in featureType:
-        try:
-            badGenes = open('union_incompatible_genes.txt')
-            badGeneList = set()
-            print("Removing genes with multiple copies on the same contig, which cause incorrect feature bins with 'union'\n\tUsing 'union_incompatible_genes.txt'")
-            for line in badGenes:
-                badGene = line.strip()
-                badGeneList.add(badGene)
-            for interval, sets in gas.steps():
-                gas[interval] = set( [ x for x in sets if x not in badGeneList ] )
-            for badGene in badGeneList:
-                try:
-                    del knownFeatures[badGene]
-                    # uncomment below to see which genes are being deleted 
-                    # print(badGene + " deleted from knownfeat")
-                except KeyError:
-                    pass
-        except IOError:
-            # There likely isn't a list of genes
-            # Recommend that the user obtain said list, or face potential errors in feature labels and counts
-            pass
-    else:
-        # not using a gene_name-type of feature in combination with --union
-        # no known issues should arise with this configuration 
-        pass
+    if featureIndex.unionIncompatible:
+        # genes with multiple copies on the same contig cause incorrect feature bins with 'union'; they were left out when the index was built
+        print("Removed {0} {1} bins of genes with multiple copies on the same contig, which cause incorrect feature bins with 'union'".format(len(featureIndex.unionIncompatible), featureType))
 
     totalTime = time.clock() - startTime
-    print("{0} sec\t{1} found:\t{2}".format(int(totalTime), featureType, len(knownFeatures)))
+    print("{0} sec\t{1} found:\t{2}".format(int(totalTime), featureType, featureIndex.numFeatures()))
 
-    return knownFeatures, gas
+    return knownFeatures, featureIndex
 
-def parseRegionBed(regionfile, regionDictIn):
+def parseRegions(regions):
+    '''
+    Read the list of regions and/or bed files from the config into a RegionIndex.
+    Regions are 'chrN:start-end' or 'chrN' strings, or [chrom, start, end] lists as written by mucor_config.py, with start and end None for a whole chromosome
+    '''
+    regionIndex = RegionIndex()
+    for item in regions:
+        if isinstance(item, list) or isinstance(item, tuple):  # this is a region from mucor_config.py
+            regionIndex.add(str(item[0]), item[1], item[2])
+        elif os.path.splitext(item)[1].lower() == '.bed':      # this item is a bed file
+            regionIndex = parseRegionBed(item, regionIndex)
+        elif str(str(item).split(':')[0]).startswith('chr'):    # this is a string 
+            reg_chr = str(item.split(':')[0])
+            try:
+                reg_str = int(str(item.split(':')[1]).split('-')[0])
+                reg_end = int(str(item.split(':')[1]).split('-')[1])
+            except IndexError:                                  # whole chromosome region [ex: chr2]
+                reg_str = None
+                reg_end = None
+            regionIndex.add(reg_chr, reg_str, reg_end)
+    regionIndex.build()
+    return regionIndex
+
+def gffRegions(regionIndex):
+    '''
+    Convert a RegionIndex into the annotation intervals to fetch for it: chromosome => list of 0-based, half open (start, end),
+    or None for a whole chromosome (see RegionIndex.intervals)
+    '''
+    return regionIndex.intervals()
+
+def parseRegionBed(regionfile, regionIndex):
     ''' 
-    Read through the supplied bed file and add the rows to the input region dictionary before returning it. Appends to the input dict, rather than overwriting it.
+    Read through the supplied bed file and add the rows to the input RegionIndex before returning it. Appends to the input index, rather than overwriting it.
+    BED intervals are 0-based and half open, so the interval (start, end) holds the 1-based positions start + 1 to end
     '''
-    regionDict = regionDictIn
     for line in open(str(regionfile),'r'):
+        if line.startswith('#') or line.startswith('track') or line.startswith('browser') or not line.strip():
+            continue
         col = line.split("\t")
         chrom = col[0]
-        start = col[1]
-        end = col[2]
-        regionDict[chrom].add((start,end))
-    return regionDict
+        start = int(col[1])
+        end = int(col[2])
+        regionIndex.add(chrom, start + 1, end)
+    return regionIndex
 
 def filterRow(row, fieldId, filters, kind):
     '''
@@ -334,34 +401,26 @@ def filterRow(row, fieldId, filters, kind):
                 break
     return False
 
-def inRegionDict(chrom, start, end, regionDict):
-    '''Checks the given mutation location to see if it is in the dictionary of regions'''
-    if regionDict[chrom]: # are there any regions of interest in the same chromosome as this mutation?
-        for locs in regionDict[chrom]: # breaking the list of regions according to chromosome should significantly decrease the number of comparisons necessary 
-            if locs[0] == 0 and locs[1] == 0: # chrN:0-0 is used to define an entire chromosome as a region of interest. 
-                return True
-            elif int(start) >= int(locs[0]) and int(end) <= int(locs[1]):
-                return True
-    return False
-
 def skipThisIndel(var, knownFeatures, featureName):
     '''
     Input a mutation and the current list of known mutations and features
-    If this mutation already exists in another form, returns True, along with the existing ref and alt.
+    If this mutation already exists in another form, returns the existing (ref, alt); otherwise an empty tuple.
         Existing in another form is defined as 2 mutations that occur in the same position and have different ref/alt, but are functionally equivalent
         Ex: ref/alt: A/AT compared to ref/alt: ATT/ATTT
         The refs and the alts are different, but both mutations represent the same T insertion
+    Equivalent indels are looked up in the feature's index of indels (see indelKey), which holds the form each was first seen in,
+    instead of comparing the mutation to every known variant of the feature
     '''
-    
-    for kvar in knownFeatures[featureName].variants: # "kvar" stands for "known variant"
-        if kvar.pos.pos == var.pos.pos and kvar.pos.chrom == var.pos.chrom and \
-        ( kvar.ref != var.ref or kvar.alt != var.alt ) and \
-        indelDelta(var.ref,var.alt)[0] == indelDelta(kvar.ref, kvar.alt)[0] and \
-        indelDelta(var.ref,var.alt)[1] == indelDelta(kvar.ref, kvar.alt)[1]:
-            return (kvar.ref, kvar.alt)
-            break
+    kvar = knownFeatures[featureName].indels.get(indelKey(var)) # "kvar" stands for "known variant"
+    if kvar is not None and kvar != (var.ref, var.alt):
+        return kvar
     return tuple()
 
+def indelKey(var):
+    '''Return the key shared by all equivalent forms of an indel: (chrom, position, inserted or deleted bases, 'INS' or 'DEL')'''
+    delta, kind = indelDelta(var.ref, var.alt)
+    return (var.chrom, var.position, delta, kind)
+
 def indelDelta(ref, alt):
     ''' Detects the inserted or deleted bases of an indel'''
     if len(alt) > len(ref):             # insertion
@@ -381,32 +440,47 @@ def groupCount(grp):
     '''
     return len(grp['sample'].unique())
 
-def annotateDF(grp, databases):
+def annotateDF(grp, databases, dbCache=None):
     '''
     function to annotate variant dataframe with user-supplied vcf databases
+    dbCache is an optional dictionary of (chr, pos, ref, alt) => database entries,
+    shared between the dataframes of several binnings so that each mutation is only looked up once
     '''
     chrom = grp['chr'].unique()[0]
     pos = grp['pos'].unique()[0]
     ref = grp['ref'].unique()[0]
     alt = grp['alt'].unique()[0]
-    var = Variant(source=None, sample=None, pos=HTSeq.GenomicPosition(chrom, pos), ref=ref, alt=alt, frac=None, dp=None, eff=None, fc=None)
+    if dbCache is not None and (chrom, pos, ref, alt) in dbCache:
+        return pd.Series(dbCache[(chrom, pos, ref, alt)])
+    var = Variant(source=None, sample=None, pos=(chrom, pos), ref=ref, alt=alt, frac=None, dp=None, eff=None, fc=None)
     dbEntries = dbLookup(var, databases)
+    if dbCache is not None:
+        dbCache[(chrom, pos, ref, alt)] = dbEntries
     return pd.Series(dbEntries)
 
-def integrateVar(var, varD, config, gas, knownFeatures, unrecognizedContigs, unrecognizedMutations):
+def integrateVars(variants, varD, config, featureIndex, knownFeatures, unrecognizedContigs, unrecognizedMutations):
     '''
-    Ingest the given variant object into the variant dictionary 
+    Bin a list of variant objects, then ingest them in order into the variant columns.
+    Binning resolves all variants on a contig with one vectorized lookup, instead of one feature index query per variant.
+    '''
+    # find bins for all variant locations
+    # each is a set of zero to n IDs (e.g. gene symbols)
+    # which I'll use as a key on the knownFeatures dict
+    # and each feature with matching ID gets allocated the variant
+    resultSets = featureIndex.findMany([ var.chrom for var in variants ], [ var.position for var in variants ])
+    for var, resultSet in zip(variants, resultSets):
+        if resultSet is None:
+            # this mutation is on a contig unknown to the feature index
+            resultSet = set()
+            unrecognizedContigs.add(var.chrom)
+            unrecognizedMutations += 1
+        varD = integrateVar(var, resultSet, varD, config, knownFeatures)
+    return varD, unrecognizedContigs, unrecognizedMutations
+
+def integrateVar(var, resultSet, varD, config, knownFeatures):
+    '''
+    Ingest the given variant object, and the set of features it falls into, into the variant columns
     '''
-    # find bin for variant location
-    try:
-        resultSet = gas[ var.pos ]      # returns a set of zero to n IDs (e.g. gene symbols)
-    except KeyError:                    # which I'll use as a key on the knownFeatures dict
-                                        # and each feature with matching ID gets allocated the variant
-        # this mutation is on a contig unknown to the GAS
-        resultSet = set()
-        unrecognizedContigs.add(var.pos.chrom)
-        unrecognizedMutations += 1
-   
     if resultSet:
         for featureName in resultSet:
             if len(var.ref) != len(var.alt): # confirm that this mutation is an indel, not a snp
@@ -415,11 +489,14 @@ def integrateVar(var, varD, config, gas, knownFeatures, unrecognizedContigs, unr
                     # Sanity check to see what indels are being overwritten by existing vars
                     var.ref = kvar[0]
                     var.alt = kvar[1]
-                knownFeatures[featureName].variants.add(var)
+                if not config.memoryBudget:
+                    # the variants of each feature are only kept for the summaries of MucorFeature, which the outputs do not use
+                    knownFeatures[featureName].variants.add(var)
+                knownFeatures[featureName].indels.setdefault(indelKey(var), (var.ref, var.alt))
     
     # Descriptive variable names
-    chr = var.pos.chrom
-    pos = int(var.pos.pos)
+    chr = var.chrom
+    pos = int(var.position)
     ref = var.ref
     alt = var.alt 
     vf = var.frac
@@ -429,28 +506,20 @@ def integrateVar(var, varD, config, gas, knownFeatures, unrecognizedContigs, unr
     fc = var.fc
     sample = var.sample
     source = var.source
-    count = 0 # initialize this database column now to save for later
-    freq = 0.0 # initialize this database column now to save for later
-    
-    # build dict to insert
-    # Step 1: define the columns and their values
-    # Step 2. zip the column names and column values together into a dictionary
-    # Step 3. Add this round to the master variants data frame dictinoary
 
+    # one row per feature; count and freq are filled in once all variants are read (see variantDataFrame)
     for feature in features.split(', '):
-        # Removing columns from the following 'columns' list will mask them from output
-        columns = ['chr','pos','ref','alt','vf','dp','feature','effect','fc','count','freq','sample','source']
-        values  = [ chr,  pos,  ref,  alt,  vf,  dp,  feature,  effect,  fc , count,  freq,  sample, source  ]
-
-        vardata = dict(zip( columns, values ))
-        for key in vardata.keys():
-            varD[key].append(vardata[key])
-    return varD, unrecognizedContigs, unrecognizedMutations
+        varD.append(chr, pos, ref, alt, vf, dp, feature, effect, fc, sample, source)
+    return varD
 
-def parseVariantFiles(config, knownFeatures, gas, databases, filters, regions, total) :
+def parseVariantFiles(config, binnings, filters, regions, spillDir=None) :
     '''
     Read in all input files
-    Record mutations in the variant dataframe 
+    Record mutations in one set of variant columns per binning
+    binnings is a list of (knownFeatures, featureIndex) tuples, one per feature type and union setting.
+    Each input file is read once, and its variants are binned into every one of them.
+    With a spill directory, the columns of each binning spill their rows to a subdirectory of it beyond the memory budget of the config.
+    Returns the list of VariantColumns, in the same order as binnings; see variantDataFrame and printPartitionedOutput
     '''
 
     startTime = time.clock()
@@ -460,151 +529,228 @@ def parseVariantFiles(config, knownFeatures, gas, databases, filters, regions, t
     # All variants stored in long (record) format
     # in a pandas dataframe
     #
-    # However, it is MUCH faster to initially store them in a python Dict
+    # However, it is MUCH faster to initially store them in typed columns (see variantcolumns.py)
     # Then convert to the pandas DF at the end
-    varD = defaultdict(list) 
+    if spillDir is None:
+        varDs = [ VariantColumns() for x in binnings ]
+    else:
+        # the rows of all binnings are read side by side, so they share the budget
+        rows = max(1, budgetRows(config.memoryBudget) // len(binnings))
+        varDs = [ VariantColumns(os.path.join(spillDir, "binning{0}".format(i)), rows) for i in range(len(binnings)) ]
     variantFiles = set(list(config.inputFiles)) # uniquify the file list, in the case of the same multi-sample VCF being defined for multiple samples
 
+    regionIndex = None
     if regions: # has the user specified any particular regions or region files to focus on?
-        regionDict = defaultdict(set)
-        for item in regions:
-            if os.path.splitext(item)[1].lower() == 'bed':      # this item is a bed file
-                regionDict = parseRegionBed(item, regionDict)
-            elif str(str(item).split(':')[0]).startswith('chr'):    # this is a string 
-                reg_chr = str(item.split(':')[0])
-                try:
-                    reg_str = str(str(item.split(':')[1]).split('-')[0])
-                    reg_end = str(str(item.split(':')[1]).split('-')[1])
-                except IndexError:                                  # represent whole chromosome regions [ex: chr2] by chrN:0-0 in the region dictionary   
-                    reg_str = 0
-                    reg_end = 0
-                regionDict[reg_chr].add((reg_str, reg_end))
+        regionIndex = parseRegions(regions)
 
     print("\n=== Reading Variant Files ===")
-    for fn in variantFiles:
-        kind = str( os.path.splitext(fn)[-1].strip('.').lower() )
-        if kind == "gz" and fn.endswith(".vcf.gz"):
-            kind = "vcf.gz"
+    if config.workers > 1 and len(variantFiles) > 1:
+        # files are parsed side by side, but binned here one after another, in the same order as sequentially:
+        # binning an indel can depend on the indels binned before it (see skipThisIndel)
+        pool = multiprocessing.Pool(min(config.workers, len(variantFiles)))
+        jobs = [ (fn, filters, regionIndex, config.source, config.filename2samples, config.samples, config.vcfReader, config.parseCache, config.threads) for fn in variantFiles ]
+        parsedFiles = itertools.izip(variantFiles, pool.imap(parseVariantFileColumns, jobs))
+    else:
+        pool = None
+        parsedFiles = ( (fn, loadOrParseVariantFile(fn, filters, regionIndex, config.source, config.filename2samples, config.samples, config.vcfReader, config.parseCache, config.threads)) for fn in variantFiles )
+    try:
+        for fn, fileVars in parsedFiles:
+            if fileVars is None:
+                # the file could not be read
+                continue
+            if pool is not None:
+                fileVars = unpackVariants(fileVars)
+            # binning may rewrite the ref/alt of an indel to that of an equivalent indel in the same feature (see skipThisIndel),
+            # so every binning after the first gets its own copies of the variants
+            binVars = [ fileVars ] + [ [ copy.copy(var) for var in fileVars ] for x in binnings[1:] ]
+            for i, (knownFeatures, featureIndex) in enumerate(binnings):
+                varDs[i], contigs, mutations = integrateVars(binVars[i], varDs[i], config, featureIndex, knownFeatures, set(), 0)
+                if i == 0:
+                    # every binning reads the same GFF/GTF, so all of them know the same contigs
+                    unrecognizedContigs |= contigs
+                    unrecognizedMutations += mutations
+            if unrecognizedContigs:
+                throwWarning("{0} Contigs and {1} mutations are in areas unknown to the feature index. If using --archive_directory, perhaps try again without it.".format( len(unrecognizedContigs), unrecognizedMutations ))
+            totalTime = time.clock() - startTime
+            print("{0:02d}:{1:02d}\t{2}".format(int(totalTime/60), int(totalTime % 60), fn))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return varDs
+
+def parseVariantFile(fn, filters, regionIndex, sources, filename2samples, samples, vcfReader="htseq", threads=1):
+    '''
+    Read one input file
+    Returns the list of its variants that passed filters and regions, in file order, or None if the file cannot be read.
+    regionIndex is the RegionIndex of the regions, or None if no regions were given; sources, filename2samples and samples are those of the config,
+    and vcfReader names the reader of VCF files (see vcfreader.py), which inflates bgzipped VCFs on threads threads.
+    If samples is None, the variants of every sample of a multi-sample VCF are kept
+    '''
+    kind = str( os.path.splitext(fn)[-1].strip('.').lower() )
+    if kind == "gz" and fn.endswith(".vcf.gz"):
+        kind = "vcf.gz"
+    try:
+        varFile = open(fn, 'rb')
+    except IOError:
+        # file does not exist or cannot be opened
+        throwWarning('{} could not be opened'.format(fn))
+        return None
+
+    fileVars = []
+    basename = os.path.basename(fn)
+    if kind == "out":
+        # parse as mutect '.out' type format, a chunk of typed columns at a time
+        # rows are filtered as they come in, to prevent them from entering the dataframe
+        # this allows us to print the dataframe directly and have consistent output with variant_details.txt, etc.
+        sample = filename2samples[basename]
+        for chroms, positions, refs, alts, vfs, dps in inputs.muTectOutChunks(varFile, filters, regionIndex):
+            fileVars.extend( Variant(basename, sample, (chrom, position), ref, alt, vf, dp, '', '')
+                             for chrom, position, ref, alt, vf, dp in itertools.izip(chroms, positions, refs, alts, vfs, dps) )
+
+    elif kind in ["vcf", "vcf.gz"]:
+        source = sources[ basename ]
+        # start vcf reader
+        # rows that fail the filters or regions are dropped by the reader, before their INFO and sample columns are decoded
+        varReader = vcfreader.openVCF(str(fn), vcfReader, source, regionIndex, filters, threads)
+        varReader.parse_meta()
+        varReader.make_info_dict()
+        parser = inputs.Parser()
         try:
-            varFile = open(fn, 'rb')
-        except IOError:
-            # file does not exist or cannot be opened
-            throwWarning('{} could not be opened'.format(fn))
-            continue    # next fn in variantFiles
-
-        if kind == "out":
-            # parse as mutect '.out' type format
-            varReader = csv.reader(varFile, delimiter="\t")
-            row = varReader.next()
-            while row[0].startswith('##'):
-                row = varReader.next()
-            header = row
-            if len(header) == 0: raise ValueError('Invalid header')
-            fieldId = dict(zip(header, range(0, len(header))))
-            for row in itertools.islice(varReader, None):
-                if filterRow(row, fieldId, filters, kind):  # filter rows as they come in, to prevent them from entering the dataframe
-                    continue                                # this allows us to print the dataframe directly and have consistent output with variant_details.txt, etc.
-                source = config.source[ os.path.basename(fn) ]
-                parser = inputs.Parser()
-                parser.row = row
-                parser.source = source
-                parser.fieldId = fieldId
-                parser.header = header
-                parser.fn = fn 
-                var = parser.parse_MuTectOUT()
-                var.sample = config.filename2samples[os.path.basename(fn)]
-                if not var:
-                    # this mutation had no data in this sample
-                    continue
-                if regions and not inRegionDict(var.pos.chrom, int(var.pos.pos), int(var.pos.pos), regionDict ):
-                    continue
-                varD, unrecognizedContigs, unrecognizedMutations = integrateVar(var, varD, config, gas, knownFeatures, unrecognizedContigs, unrecognizedMutations)
-
-        elif kind in ["vcf", "vcf.gz"]:
-            # start htseq vcf reader
-            varReader = HTSeq.VCF_Reader(str(fn))
-            varReader.parse_meta()
-            varReader.make_info_dict()
+            # resolve the parse function of the source once for the whole file, along with the sample of each sample column:
+            # if not multi-sample VCF, the sample ID is pulled from the json config,
+            # and if multi-sample VCF, the sample IDs are as defined by the VCF column(s) rather than the config.
+            # Samples not specified as samples of interest in the JSON config are left out
+            parseRow = parser.rowParser(source, varReader.sampleids, filename2samples[ basename ], samples)
             for row in varReader:
-                if row.filter not in filters:
-                    continue
-                if regions and not inRegionDict(row.pos.chrom, int(row.pos.pos), int(row.pos.pos), regionDict ):
-                    continue
                 row.unpack_info(varReader.infodict)
-                parser = inputs.Parser()
-                source = config.source[ os.path.basename(fn) ]
-                try:
-                    samps = parser.parse(row, source)
-                except KeyError:
-                    throwWarning("parsing " + fn + " as '" + source + "'")
-                    print("Cannot parse file from an unsupported or unknown variant caller. \nPlease use supported variant software, or compose an input module compatible with inputs.py")
-                    print("Options include: " + str(parser.supported_formats.keys()).replace("'",""))
-                    break
-                for var in samps:
-                    if len(samps) == 1:
-                        # if not multi-sample VCF, pull sample ID from the json config
-                        var.sample = config.filename2samples[ os.path.basename(fn) ]
-                    elif len(samps) > 1:
-                        # if multi-sample VCF, use sample ID as defined by the VCF column(s) rather than the config
-                        pass
-                    if not var or var.sample not in config.samples:
-                        # this sample has no mutation data at the given location, or this sample was not specified as a sample of interest in the JSON config 
-                        continue
-                    var.source = os.path.basename(fn)
-                    
-                    varD, unrecognizedContigs, unrecognizedMutations = integrateVar(var, varD, config, gas, knownFeatures, unrecognizedContigs, unrecognizedMutations)
-        else:
-            throwWarning("Unable to parse file with extension '{0}': {1}".format(kind, fn))
-            continue
-        if unrecognizedContigs:
-            throwWarning("{0} Contigs and {1} mutations are in areas unknown to the genomic array of sets. If using --archive_directory, perhaps try again without it.".format( len(unrecognizedContigs), unrecognizedMutations ))
-        totalTime = time.clock() - startTime
-        print("{0:02d}:{1:02d}\t{2}".format(int(totalTime/60), int(totalTime % 60), fn))
-    
-    columns = ['chr','pos','ref','alt','vf','dp','feature','effect','fc','count','freq','sample','source']
-    # Transform data frame dictionary into pandas DF. Major speed increase compared to appending variants to the DF while reading the input files. 
-    try:
-        varDF = pd.DataFrame(varD, columns=columns)
-        # Drop samples with no detected mutation at the given loc
-        varDF = varDF.dropna(subset=['dp','vf'], how='all')
-        # Cast dp, vf, and pos as appropriate types
+                for var in parseRow(row):
+                    var.source = basename
+                    fileVars.append(var)
+        except KeyError:
+            throwWarning("parsing " + fn + " as '" + source + "'")
+            print("Cannot parse file from an unsupported or unknown variant caller. \nPlease use supported variant software, or compose an input module compatible with inputs.py")
+            print("Options include: " + str(parser.supported_formats.keys()).replace("'",""))
+    else:
+        throwWarning("Unable to parse file with extension '{0}': {1}".format(kind, fn))
+        return None
+    varFile.close()
+    return fileVars
+
+def loadOrParseVariantFile(fn, filters, regionIndex, sources, filename2samples, samples, vcfReader="htseq", parseCache='', threads=1):
+    '''
+    Read one input file, as parseVariantFile, through the parse cache directory parseCache if one is given (see parsecache.py):
+    the variants of a file parsed before with the same settings, and unchanged since, are loaded from the cache instead
+    '''
+    if not parseCache:
+        return parseVariantFile(fn, filters, regionIndex, sources, filename2samples, samples, vcfReader, threads)
+    basename = os.path.basename(fn)
+    meta = parsecache.cacheMeta(fn, sources[basename], filename2samples[basename], vcfReader, filters, regionIndex)
+    if meta is None:
+        # the file cannot be read; parseVariantFile reports it
+        return parseVariantFile(fn, filters, regionIndex, sources, filename2samples, samples, vcfReader, threads)
+    fileVars = parsecache.loadParsed(parseCache, meta)
+    if fileVars is None:
+        # the variants of all samples are cached, so that the entry is still valid when the samples of interest change
+        fileVars = parseVariantFile(fn, filters, regionIndex, sources, filename2samples, None, vcfReader, threads)
+        if fileVars is None:
+            return None
+        parsecache.saveParsed(parseCache, meta, fileVars)
+    samples = set(samples)
+    return [ var for var in fileVars if var.sample in samples ]
+
+def parseVariantFileColumns(args):
+    '''
+    Worker for parseVariantFiles: read one input file.
+    Takes a single tuple of the arguments of loadOrParseVariantFile, for use with multiprocessing.Pool.imap
+    Returns the variants packed by packVariants, or None if the file cannot be read
+    '''
+    fileVars = loadOrParseVariantFile(*args)
+    if fileVars is None:
+        return None
+    return packVariants(fileVars)
+
+def packVariants(variants):
+    '''Pack variants into columns of plain values, cheap to send back from a worker'''
+    columns = tuple([] for x in range(10))
+    for var in variants:
+        for column, value in zip(columns, (var.source, var.sample, var.chrom, var.position, var.ref, var.alt, var.frac, var.dp, var.eff, var.fc)):
+            column.append(value)
+    return columns
+
+def unpackVariants(columns):
+    '''Return the list of Variants packed by packVariants'''
+    return [ Variant(source, sample, (chrom, pos), ref, alt, frac, dp, eff, fc) for source, sample, chrom, pos, ref, alt, frac, dp, eff, fc in itertools.izip(*columns) ]
+
+def variantDataFrame(varD, databases, total, dbCache=None, intDepth=None, dropColumns=None):
+    '''
+    Transform the variant columns of one binning into the variant dataframe,
+    annotated with the databases, and with the count and frequency of each mutation across samples.
+    varD may also be a partition of the columns (see printPartitionedOutput). Whether depths are int, and which database VAF columns are dropped,
+    then have to be the same in every partition: pass them as intDepth and dropColumns. By default they are decided from the rows of varD
+    '''
+    varDF = annotatedDataFrame(varD, databases, dbCache, intDepth)
+    if dropColumns is None:
+        dropColumns = uniformVAFColumns(varDF)
+    return finishDataFrame(varDF, total, dropColumns)
+
+def annotatedDataFrame(varD, databases, dbCache=None, intDepth=None):
+    '''
+    The first steps of variantDataFrame: the variant dataframe of varD, with the count of each mutation across samples and the database annotations.
+    Depths are int if intDepth, or if intDepth is None and no depth is missing
+    '''
+    if len(varD) == 0:
+        # no variants were encountered and kept
+        abortWithMessage("Variant DataFrame is empty! No mutations passed filter; check FILTER column of input VCF against allowed filters in JSON config.")
+    # Transform the variant columns into pandas DF. Major speed increase compared to appending variants to the DF while reading the input files. 
+    varDF = varD.frame()
+    # Drop samples with no detected mutation at the given loc
+    varDF = varDF.dropna(subset=['dp','vf'], how='all')
+    # dp is read as float, so that missing depths can be NaN; treat it as int if none are missing
+    if intDepth is None:
+        intDepth = not varDF['dp'].isnull().any()
+    if intDepth:
         varDF['dp'] = varDF['dp'].astype(int)
-        varDF['vf'] = varDF['vf'].astype(float)
-        varDF.pos   = varDF.pos.astype(int)
-    except UnboundLocalError:
-        if not varD:            
-            # variant dictionary is empty, implying no variants were encountered and kept
-            abortWithMessage("Variant DataFrame is empty! No mutations passed filter; check FILTER column of input VCF against allowed filters in JSON config.")
-        else:
-            abortWithMessage("Could not convert Variant Dictionary into a DataFrame")
-    except ValueError:
-        # likely couldn't convert NaN values from dp column to int
-        # proceed anyway, treating them as floats instead
-        varDF['dp'] = varDF['dp'].astype(float)
     if len(varDF) == 0:
         abortWithMessage("Variant DataFrame is empty! No mutations passed filter; check FILTER column of input VCF against allowed filters in JSON config.")
+
+    # Dataframe operation to count the number of samples that exhibit each mutation
+    # Text columns are categorical: number each mutation by the codes of its contig and alt allele and its position,
+    # then count the distinct sample codes of each
+    mutations = pd.DataFrame({'chr': varDF['chr'].cat.codes, 'pos': varDF['pos'], 'alt': varDF['alt'].cat.codes}).groupby(['chr', 'pos', 'alt']).ngroup().values
+    numSamples = len(varDF['sample'].cat.categories)
+    pairs = np.unique(mutations * numSamples + varDF['sample'].cat.codes.values.astype(np.int64))
+    varDF['count'] = np.bincount(pairs // numSamples)[mutations]
+
+    # pandas groups, and applies functions by group, much faster on object than on categorical columns,
+    # so the text columns are decoded here; the rows of each distinct value still share a single string
+    for column in CODED_COLUMNS:
+        varDF[column] = np.asarray(varDF[column])
+
     # Annotate dataframe using user-supplied vcf databases
     if databases:
         print("\n=== Comparing Your Variants to Known VCF Databases ===")
         startTime = time.clock()
-        annotSeries = varDF.groupby(['chr', 'pos', 'ref', 'alt']).apply( annotateDF, databases=databases )
+        annotSeries = varDF.groupby(['chr', 'pos', 'ref', 'alt']).apply( annotateDF, databases=databases, dbCache=dbCache )
         annotDF = pd.DataFrame(annotSeries)
         new_index = pd.Index([x for x in varDF.columns[:-4]] + [x for x in annotDF.columns] + [x for x in varDF.columns[-4:]])
         varDF = varDF.merge(annotDF, left_on=["chr", "pos", "ref", "alt"], right_index=True)[new_index]
         totalTime = time.clock() - startTime
         print("{0:02d}:{1:02d}".format(int(totalTime/60), int(totalTime % 60)))
+    return varDF
+
+def uniformVAFColumns(varDF):
+    '''
+    Return the VAF columns of databases that do not have population variant allele frequencies recorded;
+    these will manifest as a whole VAF column full of '?'
+    '''
+    return [ column for column in varDF.keys() if "_VAF" in str(column) and len(set(varDF[column])) == 1 ]
 
+def finishDataFrame(varDF, total, dropColumns):
+    '''The last steps of variantDataFrame: drop the columns dropColumns, fill in the frequency of each mutation, and fill in blank values'''
     # Delete VAF columns from databases that do not have population variant allele frequencies recorded
-    # These will manifest as a whole VAF column full of '?' 
-    for column in varDF.keys():
-        if "_VAF" in str(column) and len(set(varDF[column])) == 1:
-            varDF.drop(column, axis=1, inplace=True)
+    varDF.drop(dropColumns, axis=1, inplace=True)
  
-    # Dataframe operation to count the number of samples that exhibit each mutation
-    countSeries = varDF.groupby(['chr', 'pos', 'alt']).apply(lambda x: len(set(x['sample'])))
-    countDF = pd.DataFrame(countSeries, columns=['count'])
-    # This appears messy, but runs very fast regardless. It maps the grouped count dataframe back to the variant dataframe 
-    varDF['count'] = varDF[['chr','pos','alt']].merge(countDF, left_on=['chr','pos','alt'], right_index=True)['count']
     # Divide the count for each row in varDF by the total sample count from the JSON config file. Represents the percent of the input samples that exhibit each mutation.
     freqdict = {}
     for i in set(varDF['count'].values):
@@ -624,7 +770,17 @@ def parseVariantFiles(config, knownFeatures, gas, databases, filters, regions, t
     #stop() # this command throws a warning
     varDF.replace('', '?', inplace=True)
 
-    return varDF, knownFeatures, gas 
+    return varDF
+
+def binningOutputDir(config, featureType, union):
+    '''Return the output directory of a binning. The primary binning writes to outputDir itself'''
+    if (featureType, union) == config.binnings[0]:
+        return config.outputDir
+    if union:
+        unionstatus = "union"
+    else:
+        unionstatus = "no_union"
+    return os.path.join(config.outputDir, "{0}_{1}".format(featureType, unionstatus))
 
 def printOutput(config, outputDirName, varDF):
     '''Output run statistics and variant details to the specified output directory.'''
@@ -652,6 +808,76 @@ def printOutput(config, outputDirName, varDF):
     print("\tTime to write: {0:02d}:{1:02d}".format(int(totalTime/60), int(totalTime % 60)))
     return 0
 
+# output formats that can be written one partition of the variant rows at a time, and the column the rows are partitioned by for each.
+# Outputs sorted by feature are partitioned by feature, and outputs that collapse the rows of a mutation by contig,
+# so that all rows of an output line are in the same partition, and partitions written in order keep the outputs sorted
+PARTITION_COLUMNS = { 'default': 'feature', 'runinfo': 'feature', 'counts': 'feature', 'txt': 'feature', 'longtxt': 'feature',
+                      'bed': 'chr', 'vcf': 'chr' }
+# approximate peak memory per row while a partition is built into the variant dataframe and written in each output format:
+# about 0.4 KB for counts and long outputs, and 4 KB for outputs that collapse the rows of each mutation (txt, bed, vcf)
+FRAME_ROW_BYTES = { 'default': 4096, 'runinfo': 400, 'counts': 400, 'txt': 4096, 'longtxt': 400, 'bed': 4096, 'vcf': 4096 }
+
+def budgetRows(memoryBudget, rowBytes=ROW_BYTES):
+    '''Return the number of variant rows of rowBytes each (by default, as stored in VariantColumns) to hold in memory at a time within a memory budget in MB'''
+    return max(1, memoryBudget * 1024 * 1024 // rowBytes)
+
+def printPartitionedOutput(config, outputDirName, varD, databases, total, dbCache=None):
+    '''
+    Output run statistics and variant details to the specified output directory, as printOutput does,
+    from variant columns spilled to disk beyond the memory budget (see parseVariantFiles).
+    The variant dataframe is built and written one partition of the rows at a time (see PARTITION_COLUMNS).
+    All rows of a mutation fall in the same features, so its count across samples is the same in either partitioning.
+    Excel outputs are written whole, and are not written from partitions
+    '''
+    startTime = time.clock()
+    print("\n=== Writing output files to {0}/ ===".format(outputDirName))
+    formats = config.outputFormats
+    if "all" in formats:
+        formats = [ x for x in output.Writer().supported_formats.keys() if x not in ['all', 'default'] ]
+    skipped = [ x for x in formats if x not in PARTITION_COLUMNS ]
+    if skipped:
+        throwWarning("Output formats {0} cannot be written within a memory budget, and were skipped".format(", ".join(sorted(skipped))))
+    # writers check the formats of the config, as several formats share a writer
+    config.outputFormats = [ x for x in formats if x in PARTITION_COLUMNS ]
+    formats = config.outputFormats
+
+    # rows of a partition, within the budget for the most costly of the formats
+    partitionRows = budgetRows(config.memoryBudget, max( FRAME_ROW_BYTES[x] for x in formats )) if config.memoryBudget and formats else None
+
+    # decide over all rows what variantDataFrame decides over the whole dataframe
+    intDepth = not varD.hasMissingDepth()
+    dropColumns = []
+    if databases:
+        vafValues = defaultdict(set)
+        for partition in varD.partitions('chr', partitionRows=partitionRows):
+            partDF = annotatedDataFrame(partition, databases, dbCache, intDepth)
+            for column in partDF.keys():
+                if "_VAF" in str(column) and len(vafValues[column]) < 2:
+                    vafValues[column].update(partDF[column])
+        dropColumns = [ column for column, values in vafValues.items() if len(values) == 1 ]
+
+    rowsWritten = OrderedDict()
+    # features without a name are written as NO_FEATURE (see finishDataFrame), and sorted as such
+    for column, sortKey in [ ('feature', lambda feature: feature or 'NO_FEATURE'), ('chr', None) ]:
+        columnFormats = [ x for x in formats if PARTITION_COLUMNS.get(x) == column ]
+        if not columnFormats:
+            continue
+        partitions = 0
+        for partition in varD.partitions(column, sortKey, partitionRows):
+            partDF = variantDataFrame(partition, databases, total, dbCache, intDepth, dropColumns)
+            ow = output.Writer(append=partitions > 0, rowsWritten=rowsWritten)
+            for format in columnFormats:
+                ow.write(partDF,format,outputDirName,config)
+            partitions += 1
+        if not partitions:
+            abortWithMessage("Variant DataFrame is empty! No mutations passed filter; check FILTER column of input VCF against allowed filters in JSON config.")
+    for outputFileName, rows in rowsWritten.items():
+        print("\t{0}: {1} rows".format(outputFileName, rows))
+
+    totalTime = time.clock() - startTime
+    print("\tTime to write: {0:02d}:{1:02d}".format(int(totalTime/60), int(totalTime % 60)))
+    return 0
+
 def main():
     print(Info.logo)
     print(Info.versionInfo)
@@ -667,13 +893,15 @@ def main():
 
     if not os.path.exists(config.gff):
         abortWithMessage("Could not find GFF file {0}".format(config.gff))
-    if os.path.exists(config.outputDir) and [x for x in os.listdir(config.outputDir) if x in output.Writer().file_names.values() ]:
-        abortWithMessage("The directory {0} already exists and contains output. Will not overwrite.".format(config.outputDir))
-    elif not os.path.exists(config.outputDir):
-        try:
-            os.makedirs(config.outputDir)
-        except OSError:
-            abortWithMessage("Error when creating output directory {0}".format(config.outputDir))
+    for featureType, union in config.binnings:
+        outputDir = binningOutputDir(config, featureType, union)
+        if os.path.exists(outputDir) and [x for x in os.listdir(outputDir) if x in output.Writer().file_names.values() ]:
+            abortWithMessage("The directory {0} already exists and contains output. Will not overwrite.".format(outputDir))
+        elif not os.path.exists(outputDir):
+            try:
+                os.makedirs(outputDir)
+            except OSError:
+                abortWithMessage("Error when creating output directory {0}".format(outputDir))
 
     # check that all specified variant files exist
     for fn in config.inputFiles:
@@ -685,9 +913,29 @@ def main():
     #   or, using samples.inputFiles will use file count [non-canonical operation, ie: comparing tools, or otherwise comparing many vcf files with no regard for sample ID]
     total = len(set(config.samples))
 
-    knownFeatures, gas = parseGffFile(str(config.gff), str(config.featureType), config.fast, config.union)
-    varDF, knownFeatures, gas = parseVariantFiles(config, knownFeatures, gas, config.databases, config.filters, config.regions, total)
-    printOutput(config, str(config.outputDir), varDF)
+    # variants outside the regions are dropped as they are read, so only the annotation of the regions is needed
+    gffRegionIntervals = None
+    if config.regions:
+        gffRegionIntervals = gffRegions(parseRegions(config.regions))
+    binnings = []
+    for featureType, union in config.binnings:
+        binnings.append( parseGffFile(str(config.gff), str(featureType), config.fast, union, config.workers, config.server, gffRegionIntervals, config.fingerprintMemo) )
+    # mutations found in several binnings are only looked up in the databases once
+    dbCache = {}
+    if config.memoryBudget:
+        # variant rows beyond the budget are spilled to a scratch directory in the output directory
+        spillDir = tempfile.mkdtemp(prefix=".mucor_spill.", dir=config.outputDir)
+        try:
+            varDs = parseVariantFiles(config, binnings, config.filters, config.regions, spillDir)
+            for (featureType, union), varD in zip(config.binnings, varDs):
+                printPartitionedOutput(config, str(binningOutputDir(config, featureType, union)), varD, config.databases, total, dbCache)
+        finally:
+            shutil.rmtree(spillDir, ignore_errors=True)
+    else:
+        varDs = parseVariantFiles(config, binnings, config.filters, config.regions)
+        varDFs = [ variantDataFrame(varD, config.databases, total, dbCache) for varD in varDs ]
+        for (featureType, union), varDF in zip(config.binnings, varDFs):
+            printOutput(config, str(binningOutputDir(config, featureType, union)), varDF)
     
     # pretty print newline before exit
     print()
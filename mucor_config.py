@@ -143,7 +143,15 @@ def blankJSONDict():
     json_dict['gff'] = str("~/ref/gff_path.gff")
     json_dict['union'] = bool(True)
     json_dict['fast'] = str("~/ref/fastDir_path/") # This will be boolean "False" by default, or a str() if declared
+    json_dict['fingerprintMemo'] = bool(True) # reuse the GFF/GTF digest recorded in the archive directory while the file is unchanged
+    json_dict['workers'] = int(1)
+    json_dict['threads'] = int(1) # threads inflating each bgzipped VCF input file
+    json_dict['server'] = str("") # Unix socket of a running annotationserver.py, or empty
+    json_dict['vcfReader'] = str("htseq")
+    json_dict['parseCache'] = str("") # directory of cached parsed input files, or empty
+    json_dict['memoryBudget'] = int(0) # MB of variant rows held in memory before spilling to disk; 0 for no limit
     json_dict['feature'] = str("gene_name")
+    json_dict['binnings'] = [{"feature":"transcript_id", "union":False}]
     json_dict['samples'] = list(dict())
 
     # VCF filters
@@ -288,9 +296,24 @@ def getJSONDict(args):
     json_dict['gff'] = str(args['gff'])
     json_dict['union'] = bool(args['union'])
     json_dict['fast'] = args['archive_directory']
+    json_dict['fingerprintMemo'] = not args['rehash_gff']
+    json_dict['workers'] = int(args['processes'])
+    json_dict['threads'] = int(args['threads'])
+    json_dict['server'] = str(args['server'])
+    json_dict['vcfReader'] = str(args['vcf_reader'])
+    json_dict['parseCache'] = str(args['parse_cache'])
+    json_dict['memoryBudget'] = int(args['memory_budget'])
     json_dict['feature'] = str(args['featuretype'])
     json_dict['samples'] = list(dict())
 
+    # Additional binnings, as feature_type or feature_type:union
+    json_dict['binnings'] = []
+    for i in args['binnings']:
+        binning = i.split(':')
+        if len(binning) > 2 or (len(binning) == 2 and binning[1] != "union"):
+            abortWithMessage("Cannot process binning {0}\n\tBinnings must be given as 'feature_type' or 'feature_type:union'".format(i))
+        json_dict['binnings'].append({"feature":str(binning[0]), "union":bool(len(binning) == 2)})
+
     # VCF filters
     outFilters = set(["PASS", "."]) # By default, all mutations marked as PASS and '.' are permitted
     for i in str(args['vcf_filters']).split(','):
@@ -403,11 +426,19 @@ def main():
     parser.add_argument("-ex", "--example", action=exampleJSON)
     parser.add_argument("-g", "--gff", required=True, help="Annotation GFF/GTF for feature binning")
     parser.add_argument("-f", "--featuretype", required=True, help="Feature type into which to bin. Gencode GTF example: gene_name, gene_id, transcript_name, transcript_id, etc. ")
+    parser.add_argument("-b", "--binning", dest='binnings', metavar='<feature_type[:union]>', default=[], action='append', help="Additional feature type into which to bin in the same run, written to its own subdirectory of the output directory. Append ':union' to join its items as with -u. Can be declared >= 0 times.")
     parser.add_argument("-db", "--database", dest='databases', metavar='<dbName:/path/database.vcf.gz>', default=[], action='append', help="Colon delimited name and path to variant database in bgzipped VCF format. Can be declared >= 0 times.")
     parser.add_argument("-s", "--samples", metavar='<sample_list.txt>', required=True, help="Text file containing sample names. One sample per line.")
     parser.add_argument("-d", "--project_directory", metavar='<dirname>', required=False, help="Working/project directory, in which to find input variant call files.")
     parser.add_argument("-vcff", "--vcf_filters", default='', help="Comma separated list of VCF filters to allow. Default: PASS") # the defualt value is applied later on in the getJSONDict function, not here.
-    parser.add_argument("-a", "--archive_directory", default="", help="Specify directory in which to read/write archived annotations. Undeclared will prevent using the annotation archive features.")
+    parser.add_argument("-a", "--archive_directory", default="", help="Specify directory in which to read/write archived annotations. Undeclared will prevent using the annotation archive features. The archive is selected by a digest of the GFF/GTF contents, recorded in the directory and reused while the file's size, modification and change times and inode are unchanged (see -rh).")
+    parser.add_argument("-rh", "--rehash_gff", action="store_true", help="Hash the GFF/GTF in every run to select its archive, rather than reusing the recorded digest. Use if the annotation may be edited without changing its size or timestamps.")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="Number of worker processes used to read the annotation and the variant files. Default: 1")
+    parser.add_argument("-t", "--threads", type=int, default=1, help="Number of threads inflating each bgzipped VCF input file, in each worker process. Default: 1")
+    parser.add_argument("-S", "--server", default="", metavar='<socket>', help="Unix socket of a running annotation server (annotationserver.py) holding the feature indexes and databases. Undeclared will load them in each run.")
+    parser.add_argument("-vr", "--vcf_reader", default="htseq", choices=["htseq", "pysam"], help="Reader of VCF input files. pysam reads them with htslib, which is several times faster on large files. Default: htseq")
+    parser.add_argument("-pc", "--parse_cache", default="", metavar='<dirname>', help="Directory in which to cache the parsed variants of each input file. Later runs only parse the input files that are new or changed. Undeclared will parse every input file in every run.")
+    parser.add_argument("-mb", "--memory_budget", type=int, default=0, metavar='<MB>', help="Memory budget, in MB, of the variant rows. Rows beyond it are spilled to disk, and text outputs are written a part at a time; Excel outputs are skipped. Default: 0, no limit")
     parser.add_argument("-r", "--regions", default=[], help="Comma separated list of bed regions and/or bed files by which to limit output. Ex: chr1:10230-10240,chr2,my_regions.bed")
     parser.add_argument("-i", "--inputs", nargs="+", help="Input files")
     parser.add_argument("-u", "--union", action="store_true", help="""
@@ -416,7 +447,7 @@ def main():
         variants counted with a gene, use this option. 
         WARNING, this will lead to spurious results for features that are duplicated on the same contig.
         When feature names are identical, the bin will range from the beginning of the first instance to the end of the last, even if they are several megabases apart.
-        Refer to the documentation for a resolution using 'detect_union_bin_errors.py'
+        With a gene-centric feature type (e.g. gene_name), genes with separate copies on the same contig are detected and left out.
         """)
     parser.add_argument("-jco", "--json_config_output", required=True, help="Name of JSON configuration output file")   
     parser.add_argument("-outd", "--output_directory", required=True, help="Name of directory in which to write Mucor output")
@@ -438,6 +469,10 @@ def main():
     # Did the user supply at least 1 valid input file or project directory?
     if not args['project_directory'] and not args['inputs']:
         abortWithMessage("Must supply a valid input file(s) (-i) and/or project directory (-d)")
+    if args['processes'] < 1:
+        abortWithMessage("Number of processes must be at least 1")
+    if args['threads'] < 1:
+        abortWithMessage("Number of threads must be at least 1")
     # Does the gtf exist?
     if not os.path.exists(args['gff']):
         abortWithMessage("Could not find GFF file {0}".format(args['gff']))
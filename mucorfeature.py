@@ -30,6 +30,7 @@ class MucorFeature(HTSeq.GenomicFeature):
 		if type_ == '': raise NameError('type_ was an empty string')
 		if not isinstance(interval, HTSeq.GenomicInterval): raise TypeError('interval must be of type HTSeq.GenomicInterval')
 		self.variants = set()					# empty set to be filled with objects of class Variant
+		self.indels = {}						# indel key (see mucor.indelKey) => (ref, alt) of the first form of that indel added
 		HTSeq.GenomicFeature.__init__(self, name, type_, interval)
 	
 	def numVariants(self):
@@ -50,7 +51,7 @@ class MucorFeature(HTSeq.GenomicFeature):
 		# sorted by chrom, pos
 		uniqueVariantsTemp = set()
 		for var in self.variants:
-			candidate = (var.pos.chrom, var.pos.pos, var.ref, var.alt)
+			candidate = (var.chrom, var.position, var.ref, var.alt)
 			uniqueVariantsTemp.add(candidate)
 		# sort by chr, then position
 		# TO DO: python sorted() will sort as: chr1, chr10, chr2, chr20, chrX. Fix.
@@ -69,7 +70,7 @@ class MucorFeature(HTSeq.GenomicFeature):
 			fc = ""
 			#annot = ""
 			for varClass in self.variants:
-				if (varClass.pos.chrom, varClass.pos.pos, varClass.ref, varClass.alt) == uniqueVarTup:
+				if (varClass.chrom, varClass.position, varClass.ref, varClass.alt) == uniqueVarTup:
 					source += varClass.source + ", "
 					frac += str(varClass.frac) + ", "   
 					dp += str(varClass.dp) + ", "       
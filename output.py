@@ -28,17 +28,31 @@ import time
 from info import Info
 
 #import eucDist_output
-from mucor import abortWithMessage
-from mucor import throwWarning
+
+def abortWithMessage(message):
+    print("*** FATAL ERROR: " + message + " ***")
+    exit(2)
+
+def throwWarning(message, help = False):
+    print("*** WARNING: " + message + " ***")
+    return
 
 class Writer(object):
     """Object that parses the mucor dataframe and can write output in several different formats"""
     
-    def __init__(self):
+    def __init__(self, append=False, rowsWritten=None):
         self.data = pd.DataFrame()
         self.config = Config()
         self.outputDirName = ''
         self.attempted_formats = []     # used to prevent output modules from being executed multiple times
+        # when the data is one partition of the variant dataframe after another (see mucor.printPartitionedOutput),
+        # the writer of every partition but the first appends to the text outputs, without header, and adds its row counts to rowsWritten
+        self.append = append
+        self.rowsWritten = rowsWritten  # output file => rows written; None to print the rows of each output file as it is written
+        if append:
+            self.fileMode = 'a'
+        else:
+            self.fileMode = 'w+'
         self.supported_formats = {  "default": self.Default,
                                     "counts": self.Counts,
                                     "txt": self.VariantDetails,
@@ -93,13 +107,26 @@ class Writer(object):
         self.format = format
         self.config = config
         self.supported_formats[format]()
+
+    def report(self, outputFileName, rows):
+        '''Print the number of rows written to an output file, or add them to rowsWritten'''
+        if self.rowsWritten is None:
+            print("\t{0}: {1} rows".format(outputFileName, rows))
+        else:
+            self.rowsWritten[outputFileName] = self.rowsWritten.get(outputFileName, 0) + rows
         
     def RunInfo(self):
         '''
         Print useful information about the run, including the version, time, and configuration used 
 
         '''
+        if 'runinfo' in self.attempted_formats:
+            # already written by this writer, e.g. for both 'default' and 'runinfo'
+            return True
         self.attempted_formats.append('runinfo')
+        if self.append:
+            # written with the first partition
+            return True
         outputDirName = self.outputDirName
         outputFileName = self.file_names['runinfo']
         config = self.config
@@ -128,12 +155,15 @@ class Writer(object):
 
         Output: counts.txt
         '''
+        if 'counts' in self.attempted_formats:
+            # already written by this writer, e.g. for both 'default' and 'counts'; an appending writer would repeat the rows
+            return True
         self.attempted_formats.append('counts')
         outputDirName = self.outputDirName
         outputFileName = self.file_names['counts']
         varDF = self.data
         try:
-            ofCounts = open(outputDirName + "/" + outputFileName, 'w+')
+            ofCounts = open(outputDirName + "/" + outputFileName, self.fileMode)
         except IOError:
             abortWithMessage("Error opening output file {0}/{1}".format(outputDirName, outputFileName))
         
@@ -164,8 +194,9 @@ class Writer(object):
         # change capitalization for consistency 
         out.index.names = ['FeatureName']
 
-        mySort(out).to_csv(ofCounts, sep='\t', na_rep='?', index=True)
-        print("\t{0}: {1} rows".format(ofCounts.name, len(out)))        
+        mySort(out).to_csv(ofCounts, sep='\t', na_rep='?', index=True, header=not self.append)
+        ofCounts.close()
+        self.report(ofCounts.name, len(out))
         return True 
 
     def FeatureXSample(self):
@@ -273,7 +304,7 @@ class Writer(object):
         try:
             if txt:
                 outputFileName = self.file_names['txt']
-                ofVariantDetailsTXT = open(outputDirName + "/" + outputFileName, 'w+')
+                ofVariantDetailsTXT = open(outputDirName + "/" + outputFileName, self.fileMode)
             if xls:
                 outputFileName = self.file_names['xls']
                 ofVariantDetailsXLS = pd.ExcelWriter(str(outputDirName) + '/' + outputFileName)
@@ -291,8 +322,9 @@ class Writer(object):
 
         if txt:
             # print the new, collapsed dataframe to a file
-            mySort(out, ['feature','pos']).to_csv(ofVariantDetailsTXT, sep='\t', na_rep='?', index=False)
-            print("\t{0}: {1} rows".format(ofVariantDetailsTXT.name, len(out)))
+            mySort(out, ['feature','pos']).to_csv(ofVariantDetailsTXT, sep='\t', na_rep='?', index=False, header=not self.append)
+            ofVariantDetailsTXT.close()
+            self.report(ofVariantDetailsTXT.name, len(out))
         if xls:
             # print the new, collapsed dataframe to file a
             mySort(out, ['feature','pos']).to_excel(ofVariantDetailsXLS, 'Variant Details', na_rep='?', index=False)
@@ -331,10 +363,10 @@ class Writer(object):
         try:
             if longtxt:
                 outputFileName = self.file_names['longtxt']
-                ofLongVariantDetailsTXT = open(outputDirName + "/" + outputFileName, 'w+')
-                mySort(varDF, ['feature','pos']).to_csv(ofLongVariantDetailsTXT, sep='\t', na_rep='?', index=False)
+                ofLongVariantDetailsTXT = open(outputDirName + "/" + outputFileName, self.fileMode)
+                mySort(varDF, ['feature','pos']).to_csv(ofLongVariantDetailsTXT, sep='\t', na_rep='?', index=False, header=not self.append)
                 ofLongVariantDetailsTXT.close()
-                print("\t{0}: {1} rows".format(str(outputDirName + '/' + outputFileName), len(varDF)))
+                self.report(str(outputDirName + '/' + outputFileName), len(varDF))
                     
             if longxls:
                 outputFileName = self.file_names['longxls']
@@ -358,7 +390,7 @@ class Writer(object):
         outputFileName = self.file_names['bed']
         varDF = self.data
         try:
-            ofVariantBeds = open(outputDirName + "/" + outputFileName, 'w+')
+            ofVariantBeds = open(outputDirName + "/" + outputFileName, self.fileMode)
         except IOError:
             abortWithMessage("Error opening output file {0}/{1}".format(outputDirName, outputFileName))
         
@@ -367,7 +399,7 @@ class Writer(object):
         out = pd.DataFrame(outSeries.reset_index(drop=True))
         mySort(out, ['chr','start']).to_csv(ofVariantBeds, sep='\t', na_rep='?', index=False, header=False)
         ofVariantBeds.close()
-        print("\t{0}: {1} rows".format(ofVariantBeds.name, len(out)))
+        self.report(ofVariantBeds.name, len(out))
         return True
 
     def VCF(self):
@@ -381,12 +413,13 @@ class Writer(object):
         outputFileName = self.file_names['vcf']
         varDF = self.data
         try:
-            ofVariantVCF = open(outputDirName + "/" + outputFileName, 'w+')
+            ofVariantVCF = open(outputDirName + "/" + outputFileName, self.fileMode)
         except IOError:
             abortWithMessage("Error opening output file {0}/{1}".format(outputDirName, outputFileName))
          
         #VCF header to stream
-        ofVariantVCF.write("##fileformat=VCFv4.1\n")
+        if not self.append:
+            ofVariantVCF.write("##fileformat=VCFv4.1\n")
         
         grouped = varDF.groupby(['chr', 'pos', 'ref', 'alt'])
         vcf_fields = ['chr','pos','id','ref','alt','qual','filter','INFO']  # the relevant fields for a vcf file
@@ -396,9 +429,9 @@ class Writer(object):
         out = varDF.reindex(columns=vcf_fields).fillna('.')                 # drop the columns that are unrelated to vcf format, while reordering columns into proper vcf order
         official_vcf_fields = ['#CHROM','POS','ID', 'REF','ALT', 'QUAL', 'FILTER','INFO']   
         out.columns = pd.Index(official_vcf_fields)                         # rename columns to comply with official vcf standards
-        out.to_csv(ofVariantVCF, sep='\t', na_rep='?', index=False, header=True, sparsify=False)
+        out.to_csv(ofVariantVCF, sep='\t', na_rep='?', index=False, header=not self.append, sparsify=False)
         ofVariantVCF.close()
-        print("\t{0}: {1} rows".format(ofVariantVCF.name, len(out)))
+        self.report(ofVariantVCF.name, len(out))
         return True
 
 
@@ -0,0 +1,134 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# parsecache.py
+#
+# Cache of the parsed, filtered variants of each input file, so that a re-run of a project
+# only parses the files that were added or changed since the last run.
+# Each entry holds the variants of one file in columns: numbers in typed arrays, and text as integer codes into a table of its distinct values.
+# Entries hold only arrays of numbers and bytes, and are loaded without unpickling, as the cache directory may be shared.
+# An entry is used only if the file, the settings of its parse, and the cache version all match (see cacheMeta).
+import os
+import json
+import hashlib
+import zipfile
+import tempfile
+import numpy as np
+
+# mucor modules
+from variant import Variant
+from variantcolumns import number
+import featureindex
+
+# bump whenever parsing changes what is read from a file; older entries are then ignored and replaced
+CACHE_VERSION = 2
+
+# text columns of an entry, stored as codes
+TEXT_COLUMNS = ['source', 'sample', 'chrom', 'ref', 'alt', 'eff', 'fc']
+# kinds of the distinct values of a text column, stored next to their bytes, so that str, unicode and None values are kept apart
+TEXT_KINDS = [str, unicode, type(None)]
+
+def encodeValues(values):
+    '''Return distinct text values as a fixed-width bytes array, unicode values UTF-8 encoded, and the array of their kinds (see TEXT_KINDS)'''
+    kinds = np.array([ TEXT_KINDS.index(type(x)) for x in values ], dtype=np.int8)
+    texts = [ x.encode('utf-8') if isinstance(x, unicode) else (x or '') for x in values ]
+    return np.array(texts, dtype=np.dtype((np.string_, max([1] + [ len(x) for x in texts ])))), kinds
+
+def decodeValues(texts, kinds):
+    '''Return the distinct text values stored by encodeValues'''
+    return [ None if kind == 2 else (text.decode('utf-8') if kind == 1 else str(text)) for text, kind in zip(texts.tolist(), kinds.tolist()) ]
+
+def cacheMeta(fn, source, sample, vcfReader, filters, regionIndex):
+    '''
+    Return the meta data that the cache entry of input file fn must match: the path, size, modification time and inode of the file,
+    and the settings that decide which variants are read from it: its source (variant caller) and sample in the config,
+    the VCF reader, the allowed filters, and the regions (a RegionIndex, or None).
+    Returns None if the file cannot be read
+    '''
+    try:
+        stat = os.stat(fn)
+    except OSError:
+        return None
+    if regionIndex is not None:
+        regions = regionIndex.fingerprint()
+    else:
+        regions = None
+    return { 'version': CACHE_VERSION,
+             'path': os.path.abspath(fn),
+             'signature': [stat.st_size, stat.st_mtime, stat.st_ino],
+             'source': source,
+             'sample': sample,
+             'vcfReader': vcfReader,
+             'filters': sorted(set(filters)),
+             'regions': regions }
+
+def cachePath(cacheDir, meta):
+    '''
+    Return the cache entry of a file parsed with these settings.
+    The path is keyed by the file path and settings, but not the file signature, so the entry of a changed file is replaced rather than added to.
+    The file name is kept in the path only to make the cache directory human readable.
+    '''
+    settings = dict( (key, value) for key, value in meta.items() if key != 'signature' )
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True)).hexdigest()
+    return os.path.join(os.path.expanduser(cacheDir), "{0}.{1}.npz".format(os.path.basename(meta['path']), digest[:16]))
+
+def loadParsed(cacheDir, meta):
+    '''Return the list of Variants cached for a file with this meta data, in file order, or None if there is no valid entry'''
+    path = cachePath(cacheDir, meta)
+    try:
+        entry = np.load(path, allow_pickle=False)
+        try:
+            if json.loads(str(entry['meta'])) != json.loads(json.dumps(meta)):
+                return None
+            columns = [ entry[name] for name in ['position', 'frac', 'dp'] ]
+            for name in TEXT_COLUMNS:
+                values = decodeValues(entry[name + '_values'], entry[name + '_kinds'])
+                columns.append([ values[x] for x in entry[name + '_codes'] ])
+        finally:
+            entry.close()
+    except (IOError, ValueError, KeyError, zipfile.BadZipfile):
+        return None
+    positions, fracs, dps, sources, samples, chroms, refs, alts, effs, fcs = columns
+    return [ Variant(source, sample, (chrom, int(position)), ref, alt, frac, dp, eff, fc)
+             for position, frac, dp, source, sample, chrom, ref, alt, eff, fc
+             in zip(positions.tolist(), fracs.tolist(), dps.tolist(), sources, samples, chroms, refs, alts, effs, fcs) ]
+
+def saveParsed(cacheDir, meta, variants):
+    '''
+    Write the variants of a file to its cache entry.
+    Depths and allele frequencies are stored as numbers, NaN if missing, as they are read into the variant dataframe (see variantcolumns.py).
+    The entry is written to a temporary file next to it and renamed into place, so concurrent runs never read a partial entry
+    '''
+    path = cachePath(cacheDir, meta)
+    featureindex.makeArchiveDir(os.path.dirname(path))
+    arrays = { 'meta': np.array(json.dumps(meta)),
+               'position': np.array([ var.position for var in variants ], dtype=np.int64),
+               'frac': np.array([ number(var.frac) for var in variants ], dtype=np.float64),
+               'dp': np.array([ number(var.dp) for var in variants ], dtype=np.float64) }
+    for name in TEXT_COLUMNS:
+        valueCodes = {}
+        codes = [ valueCodes.setdefault(getattr(var, name), len(valueCodes)) for var in variants ]
+        arrays[name + '_codes'] = np.array(codes, dtype=np.int32)
+        arrays[name + '_values'], arrays[name + '_kinds'] = encodeValues(sorted(valueCodes, key=valueCodes.get))
+    entryFd, tmpPath = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=os.path.dirname(path))
+    entryFile = os.fdopen(entryFd, 'wb')
+    try:
+        np.savez(entryFile, **arrays)
+    finally:
+        entryFile.close()
+    os.chmod(tmpPath, 0o644)
+    os.rename(tmpPath, path)
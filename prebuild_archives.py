@@ -0,0 +1,107 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# prebuild_archives.py
+#
+# Build and validate the annotation archives of a GFF/GTF ahead of time,
+# so that mucor runs started together all find their archive, instead of each missing it and rebuilding it.
+from __future__ import print_function
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+# mucor modules
+import featureindex
+import mucor
+
+def abortWithMessage(message):
+    print("*** FATAL ERROR: " + message + " ***")
+    exit(2)
+
+def parseBinning(binning):
+    '''Parse a binning given as 'feature_type' or 'feature_type:union' into (featureType, union)'''
+    fields = binning.split(':')
+    if len(fields) > 2 or (len(fields) == 2 and fields[1] != "union"):
+        abortWithMessage("Cannot process binning {0}\n\tBinnings must be given as 'feature_type' or 'feature_type:union'".format(binning))
+    return fields[0], len(fields) == 2
+
+def prebuild(args):
+    '''
+    Build (unless present) and validate the archive of one binning.
+    Takes a single tuple (gffFileName, featureType, union, archiveDir) for use with multiprocessing.Pool.map
+    Returns tuple (archive path, whether it was built, seconds taken, size in bytes, list of problems)
+    '''
+    gffFileName, featureType, union, archiveDir = args
+    startTime = time.time()
+    featureIndex, path, built = mucor.loadOrBuildArchive(gffFileName, featureType, archiveDir, union)
+    buildTime = time.time() - startTime
+    meta = featureindex.archiveMeta(featureindex.cachedGffFingerprint(archiveDir, gffFileName), featureType, union)
+    return path, built, buildTime, featureindex.archiveSize(path), featureindex.checkArchive(path, meta)
+
+def main():
+    '''
+    Build the annotation archives of a GFF/GTF for a list of feature types and union settings, several at once,
+    then check each archive and report its size and build time.
+    Archives that already exist are only checked. Exits with status 1 if any archive is invalid.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--gff", required=True, help="Annotation GFF/GTF for feature binning")
+    parser.add_argument("-a", "--archive_directory", required=True, help="Directory in which to write archived annotations; pass the same directory to mucor_config.py -a")
+    parser.add_argument("-b", "--binning", dest='binnings', metavar='<feature_type[:union]>', required=True, action='append', help="Feature type for which to build an archive. Append ':union' for an archive of union bins, as with mucor_config.py -u. Can be declared >= 1 times.")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="Number of archives to build at once. Default: 1")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.gff):
+        abortWithMessage("Could not find GFF file {0}".format(args.gff))
+    if args.processes < 1:
+        abortWithMessage("Number of processes must be at least 1")
+    binnings = []
+    for binning in args.binnings:
+        if parseBinning(binning) not in binnings:
+            binnings.append(parseBinning(binning))
+
+    # fingerprint the annotation once, here, rather than in every build at the same time
+    featureindex.cachedGffFingerprint(args.archive_directory, args.gff)
+    jobs = [ (args.gff, featureType, union, args.archive_directory) for featureType, union in binnings ]
+    if args.processes > 1:
+        pool = multiprocessing.Pool(min(args.processes, len(jobs)))
+        try:
+            results = pool.map(prebuild, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [ prebuild(job) for job in jobs ]
+
+    print("\n=== Annotation archives ===")
+    valid = True
+    for (featureType, union), (path, built, buildTime, size, problems) in zip(binnings, results):
+        if built:
+            status = "built"
+        else:
+            status = "present"
+        print("{0}\tunion={1}\t{2}\t{3:.1f} MB\t{4:.1f} sec\t{5}".format(featureType, union, status, size / 1e6, buildTime, path))
+        for problem in problems:
+            print("\t*** INVALID: " + problem + " ***")
+            valid = False
+    if not valid:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# regionindex.py
+#
+# Regions of interest, for filtering variants as they are read.
+# The regions of each contig are merged into sorted, disjoint intervals,
+# so a position is checked with one binary search, however many regions a BED file holds.
+# Columns of positions, such as those of a chunk of a MuTect '.out' file, are checked with one vectorized search per contig.
+import json
+import hashlib
+from bisect import bisect_right
+from collections import defaultdict
+import numpy as np
+
+class RegionIndex(object):
+    '''
+    Regions of interest per contig, as 1-based, closed [start, end] intervals, or whole contigs.
+    Add regions with add(), then query with contains()
+    '''
+
+    def __init__(self):
+        self.regions = defaultdict(list)    # contig => list of (start, end), as added
+        self.wholeContigs = set()
+        self.starts = None                  # contig => sorted starts of the merged intervals; built on first query
+        self.ends = None                    # contig => ends of the merged intervals, in the same order
+
+    def __len__(self):
+        return len(self.wholeContigs) + sum( len(x) for x in self.regions.values() )
+
+    def add(self, chrom, start=None, end=None):
+        '''Add the region [start, end] of the contig, both 1-based and included; without start and end, add the whole contig'''
+        if start is None and end is None:
+            self.wholeContigs.add(chrom)
+        else:
+            self.regions[chrom].append( (int(start), int(end)) )
+        self.starts = None
+        self.ends = None
+
+    def build(self):
+        '''Merge the regions of each contig into sorted, disjoint intervals; intervals that touch are merged too'''
+        self.starts = {}
+        self.ends = {}
+        for chrom, intervals in self.regions.items():
+            if chrom in self.wholeContigs:
+                continue
+            starts = []
+            ends = []
+            for start, end in sorted(intervals):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self.starts[chrom] = starts
+            self.ends[chrom] = ends
+
+    def contains(self, chrom, pos):
+        '''Is the 1-based position of the contig in any region?'''
+        if chrom in self.wholeContigs:
+            return True
+        if self.starts is None:
+            self.build()
+        starts = self.starts.get(chrom)
+        if not starts:
+            return False
+        # the last interval starting at or before pos is the only one that can contain it
+        i = bisect_right(starts, pos) - 1
+        return i >= 0 and pos <= self.ends[chrom][i]
+
+    def containsMany(self, chroms, positions):
+        '''
+        Return a boolean numpy array: is each 1-based position, of the contig at the same index of chroms, in any region?
+        Positions are looked up with one vectorized binary search per contig, as contains() does one at a time
+        '''
+        chroms = np.asarray(chroms, dtype=object)
+        positions = np.asarray(positions, dtype=np.int64)
+        inRegions = np.zeros(len(positions), dtype=bool)
+        if self.starts is None:
+            self.build()
+        for chrom in set(chroms.tolist()):
+            rows = chroms == chrom
+            if chrom in self.wholeContigs:
+                inRegions[rows] = True
+                continue
+            starts = np.array(self.starts.get(chrom, []), dtype=np.int64)
+            if not len(starts):
+                continue
+            ends = np.array(self.ends[chrom], dtype=np.int64)
+            contigPositions = positions[rows]
+            # the last interval starting at or before each position is the only one that can contain it
+            i = np.searchsorted(starts, contigPositions, side='right') - 1
+            inRegions[rows] = (i >= 0) & (contigPositions <= ends[np.maximum(i, 0)])
+        return inRegions
+
+    def contigIntervals(self, chrom):
+        '''Return the merged regions of the contig as a sorted list of 1-based, closed (start, end), or None if the whole contig is a region'''
+        if chrom in self.wholeContigs:
+            return None
+        if self.starts is None:
+            self.build()
+        return zip(self.starts.get(chrom, []), self.ends.get(chrom, []))
+
+    def intervals(self):
+        '''
+        Return the regions as contig => sorted list of disjoint 0-based, half open (start, end) intervals, or None for a whole contig.
+        A variant at 1-based position pos is binned at pos, so the interval covering the variants of [start, end] is [start, end + 1)
+        '''
+        if self.starts is None:
+            self.build()
+        intervals = dict( (chrom, None) for chrom in self.wholeContigs )
+        for chrom in self.starts:
+            intervals[chrom] = [ (start, end + 1) for start, end in self.contigIntervals(chrom) ]
+        return intervals
+
+    def fingerprint(self):
+        '''Return the SHA-1 hex digest of the merged regions, the same for any two indexes holding the same positions'''
+        if self.starts is None:
+            self.build()
+        regions = [ sorted(self.wholeContigs), sorted( (chrom, self.contigIntervals(chrom)) for chrom in self.starts ) ]
+        return hashlib.sha1(json.dumps(regions)).hexdigest()
@@ -0,0 +1,96 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# test_gffregions.py
+#
+# With regions, a bgzipped and tabix indexed GFF/GTF is read only around them (mucor.constructFeatureIndex, gffreader.fetchGffLines);
+# features in the regions must get the same names as from the whole file, as long as their first contig is read.
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mucor
+import gffreader
+try:
+    import pysam
+except ImportError:
+    pass
+
+# (chrom, type, 1-based start, end, name); DUPX is on chr1 and chr3, so its chr3 copy is relabeled DUPX.chr3
+RECORDS = [ ('chr1', 'gene', 1001, 1300, 'GENE1'),
+            ('chr1', 'exon', 1001, 1100, 'GENE1'),
+            ('chr1', 'exon', 1201, 1300, 'GENE1'),
+            ('chr1', 'gene', 5001, 5100, 'DUPX'),
+            ('chr1', 'exon', 5001, 5100, 'DUPX'),
+            ('chr2', 'gene', 2001, 2100, 'GENE2'),
+            ('chr2', 'exon', 2001, 2100, 'GENE2'),
+            ('chr3', 'gene', 3001, 3100, 'DUPX'),
+            ('chr3', 'exon', 3001, 3100, 'DUPX'),
+            ('chr3', 'gene', 4001, 4300, 'GENE3'),
+            ('chr3', 'exon', 4001, 4100, 'GENE3'),
+            ('chr3', 'exon', 4201, 4300, 'GENE3') ]
+POSITIONS = [ ('chr1', 1050), ('chr1', 1250), ('chr1', 5050), ('chr3', 3050), ('chr3', 4050), ('chr3', 4250) ]
+
+@unittest.skipUnless('pysam' in sys.modules, "indexing the GTF, and reading it without the tabix module, needs pysam")
+class GffRegionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        gtf = os.path.join(self.tmpDir, 'test.gtf')
+        self.lines = [ "\t".join([chrom, 'test', type_, str(start), str(end), '.', '+', '.', 'gene_name "{0}";'.format(name)]) + "\n"
+                       for chrom, type_, start, end, name in RECORDS ]
+        gtfFile = open(gtf, 'w')
+        gtfFile.writelines(self.lines)
+        gtfFile.close()
+        self.gffFileName = pysam.tabix_index(gtf, preset='gff')
+        self.assertTrue(gffreader.tabixIndexed(self.gffFileName))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def names(self, union, regions=None):
+        featureIndex, knownFeatures, duplicateFeatures = mucor.constructFeatureIndex(self.gffFileName, 'gene_name', union, regions=regions)
+        return featureIndex.findMany([ x[0] for x in POSITIONS ], [ x[1] for x in POSITIONS ])
+
+    def test_same_names(self):
+        regions = { 'chr1': None, 'chr3': [ (2000, 6000) ] }
+        for union in [False, True]:
+            names = self.names(union, regions)
+            self.assertEqual(names, self.names(union))
+            self.assertEqual(names[3], frozenset(['DUPX.chr3']))
+
+    def test_each_record_once(self):
+        # the GENE1 gene line overlaps both intervals; with expand, they grow into one
+        regions = { 'chr1': [ (1010, 1020), (1250, 1260) ] }
+        self.assertEqual(list(gffreader.fetchGffLines(self.gffFileName, regions)), self.lines[0:3])
+        self.assertEqual(list(gffreader.fetchGffLines(self.gffFileName, regions, expand=True)), self.lines[0:3])
+        # many small regions give the same lines as the one they make up
+        regions = { 'chr3': [ (x, x + 5) for x in range(2000, 6000, 10) ] }
+        self.assertEqual(list(gffreader.fetchGffLines(self.gffFileName, regions)), self.lines[7:])
+        self.assertEqual(list(gffreader.fetchGffLines(self.gffFileName, { 'chr3': [ (4150, 4160) ] }, expand=True)), self.lines[9:])
+
+    def test_first_contig_outside_regions(self):
+        # documented difference: DUPX is not read on chr1, so its chr3 copy keeps the name
+        names = self.names(False, { 'chr3': None })
+        self.assertEqual(names[3], frozenset(['DUPX']))
+        self.assertEqual(self.names(False)[3], frozenset(['DUPX.chr3']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# test_memorybudget.py
+#
+# Outputs written a partition at a time within a memory budget (mucor.printPartitionedOutput)
+# must hold the same rows as those written from the whole variant dataframe (mucor.printOutput).
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mucor
+from config import Config
+from variantcolumns import VariantColumns
+
+SAMPLES = ['S1', 'S2', 'S3', 'S4', 'S5']
+FEATURES = ['GENE1', 'GENE2', 'GENE3', 'GENE4', 'GENE5', 'GENE6', 'GENE7']
+
+def addRows(varD):
+    '''Append the same synthetic variants, in several features, contigs and samples, to the variant columns'''
+    for i, feature in enumerate(FEATURES):
+        chrom = 'chr{0}'.format(i % 3 + 1)
+        for j in range(4):
+            pos = 1000 * (i + 1) + 10 * j
+            for k, sample in enumerate(SAMPLES):
+                if (i + j + k) % 3:
+                    varD.append(chrom, pos, 'A', 'T', 0.1 * (k + 1), 20 + j + k, feature, '', '', sample, sample + '.vcf')
+
+class PartitionedOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def writeBoth(self, formats):
+        '''Write formats from the whole dataframe and from partitions of at most 8 rows; return the two output directories'''
+        wholeDir = os.path.join(self.tmpDir, 'whole')
+        partDir = os.path.join(self.tmpDir, 'partitioned')
+        os.makedirs(wholeDir)
+        os.makedirs(partDir)
+
+        whole = VariantColumns()
+        addRows(whole)
+        config = Config()
+        config.outputFormats = list(formats)
+        mucor.printOutput(config, wholeDir, mucor.variantDataFrame(whole, {}, len(SAMPLES)))
+
+        spilled = VariantColumns(os.path.join(self.tmpDir, 'spill'), 8)
+        addRows(spilled)
+        self.assertTrue(spilled.runs)
+        config = Config()
+        config.outputFormats = list(formats)
+        mucor.printPartitionedOutput(config, partDir, spilled, {}, len(SAMPLES))
+        return wholeDir, partDir
+
+    def assertSameOutputs(self, formats, fileNames):
+        wholeDir, partDir = self.writeBoth(formats)
+        for fileName in fileNames:
+            wholeText = open(os.path.join(wholeDir, fileName)).read()
+            partText = open(os.path.join(partDir, fileName)).read()
+            self.assertEqual(partText, wholeText, fileName)
+
+    def test_default_and_counts(self):
+        # 'default' writes counts too; partitions must not append them twice
+        self.assertSameOutputs(['default', 'counts'], ['counts.txt'])
+        counts = open(os.path.join(self.tmpDir, 'partitioned', 'counts.txt')).read().splitlines()
+        self.assertEqual(len(counts), len(FEATURES) + 1)
+
+    def test_counts_and_long_details(self):
+        self.assertSameOutputs(['counts', 'longtxt', 'txt'], ['counts.txt', 'long_variant_details.txt', 'variant_details.txt'])
+
+if __name__ == '__main__':
+    unittest.main()
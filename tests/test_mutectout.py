@@ -0,0 +1,66 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# test_mutectout.py
+#
+# MuTect '.out' files are read in chunks of typed columns (inputs.muTectOutChunks);
+# a file with a header and no rows holds no variants.
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mucor
+
+HEADER = "\t".join(['contig', 'position', 'context', 'ref_allele', 'alt_allele', 'tumor_name', 'normal_name', 'score',
+                    'tumor_f', 't_ref_count', 't_alt_count', 'judgement'])
+
+def row(chrom, position, ref, alt, tumor_f, refCount, altCount, judgement):
+    return "\t".join([chrom, str(position), 'xAx', ref, alt, 'T', 'N', '0', tumor_f, str(refCount), str(altCount), judgement])
+
+class MuTectOutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def parse(self, lines):
+        '''Write lines as a MuTect .out file and return its variants'''
+        fn = os.path.join(self.tmpDir, 'sample1.out')
+        outFile = open(fn, 'w')
+        outFile.write("".join(line + "\n" for line in lines))
+        outFile.close()
+        return mucor.parseVariantFile(fn, ['KEEP'], None, {}, {'sample1.out': 'S1'}, None)
+
+    def test_header_only(self):
+        self.assertEqual(self.parse(['## muTector v1.0.27200', HEADER]), [])
+
+    def test_rows(self):
+        variants = self.parse(['## muTector v1.0.27200', HEADER,
+                               row('chr1', 221, 'A', 'T', '0.33333333333333331', 19, 28, 'KEEP'),
+                               row('chr1', 232, 'C', 'T', '0.1', 9, 1, 'REJECT')])
+        self.assertEqual(len(variants), 1)
+        var = variants[0]
+        self.assertEqual((var.sample, var.pos.chrom, var.pos.pos, var.ref, var.alt, var.frac, var.dp),
+                         ('S1', 'chr1', 221, 'A', 'T', 0.33333333333333331, 47))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# test_vcfreaders.py
+#
+# The htseq and pysam VCF readers (see vcfreader.py) must hand the parse functions the same values,
+# including for no-call samples (./.), whose sample column has no value for the FORMAT keys after GT.
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mucor
+import inputs
+import vcfreader
+
+VARSCAN_VCF = '''##fileformat=VCFv4.1
+##contig=<ID=chr1,length=1000000>
+##FILTER=<ID=PASS,Description="All filters passed">
+##INFO=<ID=ADP,Number=1,Type=Integer,Description="Average per-sample depth">
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read Depth">
+##FORMAT=<ID=FREQ,Number=1,Type=String,Description="Variant allele frequency">
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2
+chr1\t100\t.\tC\tT\t.\tPASS\tADP=10\tGT:DP:FREQ\t0/1:10:50%\t./.
+chr1\t200\t.\tG\tA\t.\tPASS\tADP=20\tGT:DP:FREQ\t./.\t0/1:20:25%
+'''
+
+def missingAsNone(value):
+    '''The column parse functions give NaN for a missing value, where the sample parse functions give None'''
+    if value is None or value != value:
+        return None
+    return value
+
+@unittest.skipUnless(vcfreader.readerAvailable('pysam'), "the pysam reader needs the pysam module")
+class NoCallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.tmpDir, 'nocall.vcf')
+        vcf = open(self.fn, 'w')
+        vcf.write(VARSCAN_VCF)
+        vcf.close()
+        self.minSamples = inputs.COLUMN_PARSE_MIN_SAMPLES
+
+    def tearDown(self):
+        inputs.COLUMN_PARSE_MIN_SAMPLES = self.minSamples
+        shutil.rmtree(self.tmpDir)
+
+    def parse(self, reader):
+        variants = mucor.parseVariantFile(self.fn, ['PASS'], None, {'nocall.vcf': 'VarScan'}, {'nocall.vcf': 'CFG'}, None, reader)
+        return sorted( (x.pos.pos, x.sample, missingAsNone(x.dp), missingAsNone(x.frac)) for x in variants )
+
+    def test_sample_parse(self):
+        htseq = self.parse('htseq')
+        self.assertEqual(htseq, [ (100, 'S1', 10, 0.5), (100, 'S2', None, None), (200, 'S1', None, None), (200, 'S2', 20, 0.25) ])
+        self.assertEqual(self.parse('pysam'), htseq)
+
+    def test_column_parse(self):
+        # the column parse function reads the same values through formatColumns
+        inputs.COLUMN_PARSE_MIN_SAMPLES = 1
+        self.assertEqual(self.parse('pysam'), self.parse('htseq'))
+
+if __name__ == '__main__':
+    unittest.main()
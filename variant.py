@@ -18,19 +18,35 @@
 # variant.py
 
 from __future__ import print_function
+import HTSeq
 
-class Variant:
-	'''Data about SNV and Indels'''
+class Variant(object):
+	'''
+	Data about SNV and Indels.
+	Slots instead of a per-instance __dict__, and the location as a contig and an int instead of an HTSeq.GenomicPosition,
+	keep each of the many variants alive during a cohort run to a few machine words
+	'''
+	__slots__ = ('source', 'sample', 'chrom', 'position', 'ref', 'alt', 'frac', 'dp', 'eff', 'fc')
 	def __init__(self,source,sample,pos,ref,alt,frac,dp, eff,fc):
 		self.source = source	# source of variant - typically a filename
 		self.sample = sample	# sample ID, as defined in the VCF 
-		self.pos = pos			# HTSeq.GenomicPosition
+		if isinstance(pos, tuple):
+			self.chrom, self.position = pos	# (contig, position)
+		else:
+			self.chrom = pos.chrom			# HTSeq.GenomicPosition
+			self.position = pos.pos
 		self.ref = ref
 		self.alt = alt
 		self.frac = frac     
 		self.dp = dp            
 		self.eff = eff          
 		self.fc = fc
+	@property
+	def pos(self):
+		'''HTSeq.GenomicPosition of the variant, built on every access; use chrom and position where many variants are read'''
+		return HTSeq.GenomicPosition(self.chrom, self.position)
+	def __copy__(self):
+		return Variant(self.source, self.sample, (self.chrom, self.position), self.ref, self.alt, self.frac, self.dp, self.eff, self.fc)
 	def __str__(self):
 		out = ""
 		for k,v in {'source':self.source, 'sample':self.sample, 'pos':self.pos, 'ref':self.ref, 'alt':self.alt, 'frac':self.frac, 'dp':self.dp, 'eff':self.eff, 'fc':self.fc}.items():
@@ -0,0 +1,253 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# variantcolumns.py
+#
+# Columnar store of the binned variants of one binning, from which the variant dataframe is built.
+# Numbers are kept in typed arrays, and text in integer codes into a list of the distinct values of each column,
+# so a row costs a few dozen bytes instead of a dictionary and thirteen list entries of Python objects.
+#
+# Given a spill directory, the rows are written out to it in runs whenever the rows in memory reach a limit,
+# and are read back one partition at a time (see VariantColumns.partitions), so memory stays bounded however many variants are read.
+# A run is a directory of one .npy file per column, memory-mapped when it is read back.
+import os
+import shutil
+import tempfile
+from array import array
+import numpy as np
+import pandas as pd
+
+# columns of the variant dataframe, in order
+COLUMNS = ['chr','pos','ref','alt','vf','dp','feature','effect','fc','count','freq','sample','source']
+# text columns, stored as codes
+CODED_COLUMNS = ['chr','ref','alt','feature','effect','fc','sample','source']
+# a row as stored: pos, vf and dp as in VariantColumns, and the code of each coded column
+ROW_DTYPE = np.dtype([ ('pos', np.dtype('l')), ('vf', np.float64), ('dp', np.float64) ] + [ (column, np.int32) for column in CODED_COLUMNS ])
+# memory per row held by VariantColumns
+ROW_BYTES = ROW_DTYPE.itemsize
+
+def number(value):
+    '''Return a depth or allele frequency as a float; NaN if it is missing or not a number'''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+def codeValues(valueCodes):
+    '''Return the distinct values of a coded column, indexed by code'''
+    return sorted(valueCodes, key=valueCodes.get)
+
+def variantFrame(pos, vf, dp, codes, valueCodes):
+    '''
+    Return the variant dataframe of rows given as numpy arrays, with count and freq initialized to 0.
+    codes and valueCodes hold, in the order of CODED_COLUMNS, the codes of the rows and the distinct values => code of each coded column.
+    pos is int, vf float, and dp float, as missing values are NaN
+    '''
+    data = dict( (column, pd.Categorical.from_codes(columnCodes, codeValues(columnValueCodes)))
+                 for column, columnCodes, columnValueCodes in zip(CODED_COLUMNS, codes, valueCodes) )
+    data['pos'] = pos
+    data['vf'] = vf
+    data['dp'] = dp
+    data['count'] = np.zeros(len(pos), dtype=int)
+    data['freq'] = np.zeros(len(pos), dtype=float)
+    return pd.DataFrame(data, columns=COLUMNS)
+
+def concatenateRuns(runs):
+    '''Concatenate runs of rows, each as VariantColumns.arrays returns them, into a single one'''
+    return ( np.concatenate([ run[0] for run in runs ]),
+             np.concatenate([ run[1] for run in runs ]),
+             np.concatenate([ run[2] for run in runs ]),
+             [ np.concatenate([ run[3][i] for run in runs ]) for i in range(len(CODED_COLUMNS)) ] )
+
+class VariantColumns(object):
+    '''
+    Append-only columns of binned variants, one row per variant and feature.
+    Given a spill directory, at most spillRows rows are held in memory; older rows are spilled to the directory
+    '''
+
+    def __init__(self, spillDir=None, spillRows=0):
+        self.pos = array('l')
+        self.vf = array('d')
+        self.dp = array('d')
+        # per coded column, in the order of CODED_COLUMNS: the codes of its rows, and its distinct values => code
+        self.codes = [ array('i') for column in CODED_COLUMNS ]
+        self.valueCodes = [ {} for column in CODED_COLUMNS ]
+        self.spillDir = spillDir    # directory of the spilled runs, or None to hold every row in memory
+        self.spillRows = spillRows
+        self.runs = []              # directories of the spilled runs, oldest first
+        self.spilledRows = 0
+
+    def __len__(self):
+        return self.spilledRows + len(self.pos)
+
+    def append(self, chr, pos, ref, alt, vf, dp, feature, effect, fc, sample, source):
+        '''Add one row'''
+        self.pos.append(pos)
+        self.vf.append(number(vf))
+        self.dp.append(number(dp))
+        for codes, valueCodes, value in zip(self.codes, self.valueCodes, (chr, ref, alt, feature, effect, fc, sample, source)):
+            codes.append(valueCodes.setdefault(value, len(valueCodes)))
+        if self.spillDir is not None and len(self.pos) >= self.spillRows:
+            self.spill()
+
+    def arrays(self):
+        '''Return the rows in memory as numpy arrays: pos, vf, dp, and the list of the codes of each coded column'''
+        return ( np.frombuffer(self.pos, dtype=np.dtype('l')),
+                 np.frombuffer(self.vf, dtype=np.float64),
+                 np.frombuffer(self.dp, dtype=np.float64),
+                 [ np.frombuffer(codes, dtype=np.int32) for codes in self.codes ] )
+
+    def spill(self):
+        '''Write the rows in memory to a new run in the spill directory, and release them'''
+        if not self.pos:
+            return
+        runDir = os.path.join(self.spillDir, "run{0:05d}".format(len(self.runs)))
+        os.makedirs(runDir)
+        pos, vf, dp, codes = self.arrays()
+        for name, values in zip(['pos', 'vf', 'dp'] + CODED_COLUMNS, [pos, vf, dp] + codes):
+            np.save(os.path.join(runDir, name + ".npy"), values)
+        self.runs.append(runDir)
+        self.spilledRows += len(self.pos)
+        self.pos = array('l')
+        self.vf = array('d')
+        self.dp = array('d')
+        self.codes = [ array('i') for column in CODED_COLUMNS ]
+
+    def allArrays(self):
+        '''Yield the rows of each spilled run, memory-mapped, then the rows in memory, each as arrays() returns them'''
+        for runDir in self.runs:
+            columns = [ np.load(os.path.join(runDir, name + ".npy"), mmap_mode='r') for name in ['pos', 'vf', 'dp'] + CODED_COLUMNS ]
+            yield columns[0], columns[1], columns[2], columns[3:]
+        if self.pos:
+            yield self.arrays()
+
+    def column(self, column):
+        '''Return a coded column of the rows in memory as a pandas Categorical'''
+        i = CODED_COLUMNS.index(column)
+        return pd.Categorical.from_codes(np.frombuffer(self.codes[i], dtype=np.int32), codeValues(self.valueCodes[i]))
+
+    def frame(self):
+        '''
+        Return the variant dataframe of the rows, with count and freq initialized to 0.
+        pos is int, vf float, and dp float, as missing values are NaN.
+        Spilled rows are read back too; use partitions() to read spilled columns a part at a time
+        '''
+        if self.runs:
+            pos, vf, dp, codes = concatenateRuns(list(self.allArrays()))
+        else:
+            pos, vf, dp, codes = self.arrays()
+        return variantFrame(pos, vf, dp, codes, self.valueCodes)
+
+    def hasMissingDepth(self):
+        '''Is the depth missing from any row that has an allele frequency?'''
+        return any( (np.isnan(dp) & ~np.isnan(vf)).any() for pos, vf, dp, codes in self.allArrays() )
+
+    def partitions(self, column, sortKey=None, partitionRows=None):
+        '''
+        Yield the rows in partitions by the values of a coded column, each a VariantRows holding every row of a run of values.
+        Values are taken in the order of sortKey(value), or of the values themselves,
+        and a partition holds at most partitionRows rows (spillRows if not given), unless a single value has more.
+        Rows keep the order in which they were appended.
+        Rows with neither an allele frequency nor a depth are left out, as the variant dataframe drops them.
+        Spilled rows are read once, and routed to a file per partition (see routeRows), from which each partition is read back
+        '''
+        i = CODED_COLUMNS.index(column)
+        partitionRows = partitionRows or self.spillRows
+        values = codeValues(self.valueCodes[i])
+        rowsPerValue = np.zeros(len(values), dtype=np.int64)
+        for pos, vf, dp, codes in self.allArrays():
+            kept = ~(np.isnan(vf) & np.isnan(dp))
+            rowsPerValue += np.bincount(codes[i][kept], minlength=len(values))
+        order = sorted( [ code for code in range(len(values)) if rowsPerValue[code] ], key=lambda code: sortKey(values[code]) if sortKey else values[code] )
+        # partition of each value; -1 for values without rows
+        partitionOf = np.empty(len(values), dtype=np.int64)
+        partitionOf.fill(-1)
+        numPartitions = 0
+        start = 0
+        while start < len(order):
+            # extend the partition by the next values while they fit
+            end = start + 1
+            rows = rowsPerValue[order[start]]
+            while end < len(order) and rows + rowsPerValue[order[end]] <= partitionRows:
+                rows += rowsPerValue[order[end]]
+                end += 1
+            partitionOf[order[start:end]] = numPartitions
+            numPartitions += 1
+            start = end
+        if not self.runs:
+            pos, vf, dp, codes = self.arrays()
+            rows = routeRows((pos, vf, dp, codes), i, partitionOf)
+            for partition in range(numPartitions):
+                rowIndex = rows[partition]
+                yield VariantRows(pos[rowIndex], vf[rowIndex], dp[rowIndex], [ columnCodes[rowIndex] for columnCodes in codes ], self.valueCodes)
+            return
+        partitionDir = tempfile.mkdtemp(prefix="partitions.", dir=self.spillDir)
+        try:
+            fileNames = [ os.path.join(partitionDir, "partition{0:05d}".format(partition)) for partition in range(numPartitions) ]
+            for arrays in self.allArrays():
+                pos, vf, dp, codes = arrays
+                for partition, rowIndex in sorted(routeRows(arrays, i, partitionOf).items()):
+                    packed = np.empty(len(rowIndex), dtype=ROW_DTYPE)
+                    packed['pos'] = pos[rowIndex]
+                    packed['vf'] = vf[rowIndex]
+                    packed['dp'] = dp[rowIndex]
+                    for name, columnCodes in zip(CODED_COLUMNS, codes):
+                        packed[name] = columnCodes[rowIndex]
+                    partitionFile = open(fileNames[partition], 'ab')
+                    try:
+                        packed.tofile(partitionFile)
+                    finally:
+                        partitionFile.close()
+            for fileName in fileNames:
+                packed = np.fromfile(fileName, dtype=ROW_DTYPE)
+                os.remove(fileName)
+                yield VariantRows(packed['pos'], packed['vf'], packed['dp'], [ packed[name] for name in CODED_COLUMNS ], self.valueCodes)
+        finally:
+            shutil.rmtree(partitionDir, ignore_errors=True)
+
+def routeRows(arrays, i, partitionOf):
+    '''
+    Return the rows of arrays (as VariantColumns.arrays returns them) of each partition, as partition => row numbers in order,
+    given the partition of each value of coded column number i; rows with neither an allele frequency nor a depth are left out
+    '''
+    pos, vf, dp, codes = arrays
+    partitions = partitionOf[codes[i]]
+    partitions[np.isnan(vf) & np.isnan(dp)] = -1
+    # a stable sort keeps the rows of each partition in order
+    rowOrder = np.argsort(partitions, kind='mergesort')
+    sortedPartitions = partitions[rowOrder]
+    present = np.unique(sortedPartitions)
+    starts = np.searchsorted(sortedPartitions, present, side='left')
+    ends = np.searchsorted(sortedPartitions, present, side='right')
+    return dict( (partition, rowOrder[start:end]) for partition, start, end in zip(present.tolist(), starts, ends) if partition >= 0 )
+
+class VariantRows(object):
+    '''A partition of VariantColumns, as numpy arrays coded with the distinct values of the whole columns'''
+
+    def __init__(self, pos, vf, dp, codes, valueCodes):
+        self.pos = pos
+        self.vf = vf
+        self.dp = dp
+        self.codes = codes
+        self.valueCodes = valueCodes
+
+    def __len__(self):
+        return len(self.pos)
+
+    def frame(self):
+        '''Return the variant dataframe of the rows, as VariantColumns.frame does'''
+        return variantFrame(self.pos, self.vf, self.dp, self.codes, self.valueCodes)
@@ -0,0 +1,398 @@
+#    Copyright 2013-2015 James S Blachly, MD and The Ohio State University
+#
+#    This file is part of Mucor.
+#
+#    Mucor is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Mucor is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Mucor.  If not, see <http://www.gnu.org/licenses/>.
+
+# vcfreader.py
+#
+# VCF readers for the input files.
+# HTSeq.VCF_Reader splits every field of every line, and converts every INFO value, in Python;
+# HTSeqVCFReader reads the same rows, converting only the INFO values the parse functions read.
+# PysamVCFReader reads with htslib, through pysam.VariantFile, and hands the parse functions of inputs.py
+# rows that look like those of HTSeq, holding only the INFO and FORMAT values the parse functions read.
+# Either reader can be limited to regions, reading a bgzipped VCF through its tabix or CSI index,
+# and rejects the rows of other regions or FILTER values before decoding anything past the first columns.
+# Either reader inflates a bgzipped VCF on a configurable number of threads.
+# The sample columns of a row are decoded on demand, either per sample (row.samples, as HTSeq has them),
+# or per FORMAT key across the sample columns (row.formatColumns), for the column parse functions of inputs.py.
+import os
+import sys
+import itertools
+import HTSeq
+import numpy as np
+try:
+    import pysam
+except ImportError:
+    pass
+
+# mucor modules
+import inputs
+import bgzf
+
+# names of the readers, as given in the JSON config
+READERS = ["htseq", "pysam"]
+
+# same as HTSeq._vcf_typemap
+INFO_TYPES = {  "Integer": int,
+                "Float": float,
+                "String": str,
+                "Flag": bool }
+
+def readerAvailable(reader):
+    '''Can the named reader be used? The pysam reader needs the pysam module'''
+    return reader == "htseq" or (reader == "pysam" and 'pysam' in sys.modules)
+
+def openVCF(fn, reader, source, regionIndex=None, filters=None, threads=1):
+    '''
+    Open the VCF file with the named reader, for files of the given source (variant caller).
+    Either reader is used like HTSeq.VCF_Reader: parse_meta(), make_info_dict(), then iterate rows,
+    calling row.unpack_info(reader.infodict) before handing a row to inputs.Parser.parse
+    Only the rows whose FILTER is one of filters, if given, and that are in the regions of a RegionIndex, if given, are read;
+    the others are rejected before their INFO and sample columns are decoded.
+    If the file is bgzipped and indexed, only the rows in the regions are read at all, through the index.
+    Bgzipped files are inflated on threads threads
+    '''
+    queries = None
+    index = indexFile(fn)
+    if regionIndex is not None and index is not None:
+        queries = regionQueries(fn, index, regionIndex)
+    if filters is not None:
+        filters = frozenset(filters)
+    if reader == "pysam":
+        return PysamVCFReader(fn, inputs.FORMAT_KEYS.get(source, []), inputs.INFO_KEYS, index, queries, filters, regionIndex, threads)
+    if queries is not None:
+        return HTSeqIndexedVCFReader(fn, inputs.INFO_KEYS, index, queries, filters, regionIndex, threads)
+    return HTSeqVCFReader(fn, inputs.INFO_KEYS, filters, regionIndex, threads)
+
+def indexFile(fn):
+    '''Return the path of the tabix (.tbi) or CSI (.csi) index of a bgzipped VCF, or None if it has none, or pysam is missing to read it'''
+    if 'pysam' not in sys.modules or not fn.lower().endswith(".vcf.gz"):
+        return None
+    for extension in [".tbi", ".csi"]:
+        if os.path.exists(fn + extension):
+            return fn + extension
+    return None
+
+def regionQueries(fn, index, regionIndex):
+    '''
+    Return the index queries (contig, start, end) reading the rows of the regions of a RegionIndex, 0-based and half open, in file order.
+    start and end are None to read a whole contig.
+    Contigs are taken in the order of the index, which lists them in the order they appear in the file
+    '''
+    tbx = pysam.TabixFile(fn, index=index)
+    try:
+        contigs = list(tbx.contigs)
+    finally:
+        tbx.close()
+    queries = []
+    for contig in contigs:
+        intervals = regionIndex.contigIntervals(contig)
+        if intervals is None:
+            queries.append( (contig, None, None) )
+        else:
+            queries.extend( (contig, start - 1, end) for start, end in intervals )
+    return queries
+
+def inQuery(pos, start, end):
+    '''
+    Does a row at 1-based position pos start within the query (start, end)?
+    A query also returns rows that start before it and reach into it, such as long deletions; those are read by the query they start in
+    '''
+    return start is None or start < pos <= end
+
+class HTSeqRow(HTSeq.VariantCall):
+    '''HTSeq.VariantCall that keeps the sample columns of its line as text until they are read'''
+
+    @classmethod
+    def fromfields(cls, fields, reader):
+        '''
+        Read a VCF line, split into its first eight columns and the rest (see HTSeqVCFReader.rows), as HTSeq.VariantCall.fromline does,
+        except for the sample columns
+        '''
+        ret = cls()
+        ret.chrom, ret.pos, ret.id, ret.ref, ret.alt, ret.qual, ret.filter, ret.info = fields[:8]
+        if reader.nsamples == 0:
+            ret.format = None
+            ret.sampleFields = []
+        else:
+            sampleColumns = fields[8].split("\t")
+            ret.format = sampleColumns[0].split(":")
+            ret.sampleFields = sampleColumns[1:]
+        ret.sampleids = reader.sampleids
+        ret.infoKeys = reader.infoKeys
+        ret.pos = HTSeq.GenomicPosition(ret.chrom, int(ret.pos))
+        ret.alt = ret.alt.split(",")
+        ret._samples = None
+        return ret
+
+    def unpack_info(self, infodict):
+        '''
+        Decode the INFO values the parse functions read (the infoKeys of the reader), as HTSeq.VariantCall.unpack_info would:
+        converted by the type of their key in infodict, or split into strings if the key is undeclared
+        '''
+        info = {}
+        for token in self.info.strip(";").split(";"):
+            key, equals, value = token.partition("=")
+            if key not in self.infoKeys:
+                continue
+            if not equals:
+                # Flag
+                info[key] = True
+                continue
+            values = value.split("=")[0].split(",")
+            if key in infodict:
+                values = map(infodict[key], values)
+            if len(values) == 1:
+                values = values[0]
+            info[key] = values
+        for key in self.infoKeys:
+            if key not in info and infodict.get(key) == bool:
+                info[key] = False
+        self.info = info
+
+    @property
+    def samples(self):
+        '''The FORMAT values of each sample, as {sample: {key: text}}, decoded on first use'''
+        if self._samples is None:
+            self._samples = {}
+            for sid, field in itertools.izip(self.sampleids, self.sampleFields):
+                self._samples[sid] = dict(itertools.izip(self.format, field.split(":")))
+        return self._samples
+
+    def formatColumns(self, keys, columns):
+        '''
+        Return the FORMAT values of the given keys in the sample columns numbered columns (0 for the first sample),
+        as {key: list of the text value of each column, None where the column has no value for the key}
+        '''
+        fields = [ self.sampleFields[i].split(":") for i in columns ]
+        out = {}
+        for key in keys:
+            if self.format and key in self.format:
+                j = self.format.index(key)
+                out[key] = [ x[j] if j < len(x) else None for x in fields ]
+            else:
+                out[key] = [None] * len(fields)
+        return out
+
+class HTSeqVCFReader(HTSeq.VCF_Reader):
+    '''
+    HTSeq.VCF_Reader reading HTSeqRows, decoding only the given INFO keys of each row.
+    Rows whose FILTER is not one of filters, or outside the regions of a RegionIndex, are skipped
+    by the text of their first columns, before the rest of the line is split.
+    A bgzipped file is inflated on threads threads (see bgzf.py); other gzipped files are read as HTSeq reads them
+    '''
+
+    def __init__(self, filename, infoKeys, filters=None, regionIndex=None, threads=1):
+        if bgzf.isBgzf(filename):
+            HTSeq.VCF_Reader.__init__(self, bgzf.BgzfLines(filename, threads))
+        else:
+            HTSeq.VCF_Reader.__init__(self, filename)
+        self.filename = filename
+        self.threads = threads
+        self.infoKeys = frozenset(infoKeys)
+        self.allowedFilters = filters
+        self.regionIndex = regionIndex
+
+    def rows(self, lines):
+        '''Yield the HTSeqRows of the VCF lines that pass the filters and regions'''
+        filters = self.allowedFilters
+        regionIndex = self.regionIndex
+        for line in lines:
+            if line == "\n" or line.startswith('#'):
+                continue
+            fields = line.rstrip("\n").split("\t", 8)
+            if filters is not None and fields[6] not in filters:
+                continue
+            if regionIndex is not None and not regionIndex.contains(fields[0], int(fields[1])):
+                continue
+            yield HTSeqRow.fromfields(fields, self)
+
+    def __iter__(self):
+        return self.rows(HTSeq.FileOrSequence.__iter__(self))
+
+class HTSeqIndexedVCFReader(HTSeqVCFReader):
+    '''HTSeqVCFReader reading only the rows of the given queries (see regionQueries), through the index of the bgzipped file'''
+
+    def __init__(self, filename, infoKeys, index, queries, filters=None, regionIndex=None, threads=1):
+        HTSeqVCFReader.__init__(self, filename, infoKeys, filters, regionIndex, threads)
+        self.index = index
+        self.queries = queries
+
+    def queryLines(self):
+        '''Yield the lines of the queries'''
+        tbx = pysam.TabixFile(self.filename, index=self.index, threads=self.threads)
+        try:
+            for contig, start, end in self.queries:
+                for line in tbx.fetch(contig, start, end):
+                    if inQuery(int(line.split("\t", 2)[1]), start, end):
+                        yield line
+        finally:
+            tbx.close()
+
+    def __iter__(self):
+        return self.rows(self.queryLines())
+
+def valueText(value):
+    '''Return a value decoded by htslib as text, as HTSeq would read it from the VCF line'''
+    if value is None:
+        return '.'
+    if isinstance(value, tuple):
+        return ','.join([ valueText(x) for x in value ])
+    if isinstance(value, float):
+        # htslib keeps floats in single precision; this is the shortest text giving the same single precision value,
+        # which is the text of the file unless it had more digits than single precision holds
+        return str(np.float32(value))
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+def isMissing(value):
+    '''Is a value decoded by htslib missing? Missing numbers are None, and missing strings '.'''
+    return value is None or value == '.' or (isinstance(value, tuple) and all( isMissing(x) for x in value ))
+
+def formatText(value):
+    '''
+    Return a FORMAT value decoded by htslib as text, or None if it is missing: htslib gives missing values for the keys
+    a sample column leaves out, e.g. after the GT of a no-call sample (./.), where HTSeq reads the sample without those keys
+    '''
+    if isMissing(value):
+        return None
+    return valueText(value)
+
+class PysamVCFReader(object):
+    '''
+    Reads a VCF or bgzipped VCF with pysam.VariantFile.
+    Only the given FORMAT keys and INFO keys are decoded for each row, and only for rows that are unpacked.
+    If index queries are given (see regionQueries), only their rows are read, through the given index of the file.
+    Records whose FILTER is not one of filters, or outside the regions of a RegionIndex, are skipped before a row is made of them.
+    htslib inflates a bgzipped file on threads threads
+    '''
+
+    def __init__(self, filename, formatKeys, infoKeys, index=None, queries=None, filters=None, regionIndex=None, threads=1):
+        # htslib reports a bgzipped file without an index, which is not needed to read the whole file
+        verbosity = pysam.set_verbosity(0)
+        try:
+            self.vcf = pysam.VariantFile(filename, index_filename=index, threads=threads)
+        finally:
+            pysam.set_verbosity(verbosity)
+        self.formatKeys = formatKeys
+        self.infoKeys = infoKeys
+        self.queries = queries
+        self.allowedFilters = filters
+        self.regionIndex = regionIndex
+        self.sampleids = []
+        self.infodict = {}
+
+    def parse_meta(self):
+        self.sampleids = list(self.vcf.header.samples)
+
+    def make_info_dict(self):
+        self.infodict = dict( (key, INFO_TYPES[info.type]) for key, info in self.vcf.header.info.items() )
+
+    def records(self):
+        '''Yield the records of the file, or of the queries'''
+        if self.queries is None:
+            for record in self.vcf:
+                yield record
+        else:
+            for contig, start, end in self.queries:
+                for record in self.vcf.fetch(contig, start, end):
+                    if inQuery(record.pos, start, end):
+                        yield record
+
+    def __iter__(self):
+        filters = self.allowedFilters
+        regionIndex = self.regionIndex
+        # htslib warns about every contig and INFO key missing from the header; HTSeq does not need them either
+        verbosity = pysam.set_verbosity(0)
+        try:
+            for record in self.records():
+                rowFilter = ';'.join(record.filter.keys()) or '.'
+                if filters is not None and rowFilter not in filters:
+                    continue
+                if regionIndex is not None and not regionIndex.contains(record.chrom, record.pos):
+                    continue
+                yield PysamRow(record, self, rowFilter)
+        finally:
+            pysam.set_verbosity(verbosity)
+            self.vcf.close()
+
+class PysamRow(object):
+    '''One row of a PysamVCFReader, with the attributes of an HTSeq.VariantCall that mucor uses'''
+
+    def __init__(self, record, reader, rowFilter):
+        self.record = record
+        self.reader = reader
+        self.chrom = record.chrom
+        self.pos = HTSeq.GenomicPosition(record.chrom, record.pos)
+        self.ref = record.ref
+        self.alt = list(record.alts or ['.'])
+        self.filter = rowFilter
+        self.info = None
+        self._samples = None
+
+    def unpack_info(self, infodict):
+        '''
+        Decode the INFO values the parse functions read, as HTSeq.VariantCall.unpack_info would:
+        converted by the type of their key in infodict, or split into strings if the key is undeclared
+        '''
+        record = self.record
+        self.info = {}
+        for key in self.reader.infoKeys:
+            if key not in record.info:
+                if infodict.get(key) == bool:
+                    self.info[key] = False
+                continue
+            value = record.info[key]
+            if value is True:
+                # Flag
+                self.info[key] = True
+                continue
+            values = valueText(value).split(',')
+            if key in infodict:
+                values = map(infodict[key], values)
+            if len(values) == 1:
+                values = values[0]
+            self.info[key] = values
+
+    @property
+    def samples(self):
+        '''The FORMAT values the parse functions read, as text, in a dictionary per sample; decoded on first use'''
+        if self._samples is None:
+            record = self.record
+            keys = [ key for key in self.reader.formatKeys if key in record.format ]
+            self._samples = {}
+            for sample, values in zip(self.reader.sampleids, record.samples.values()):
+                texts = {}
+                for key in keys:
+                    text = formatText(values[key])
+                    # left out, as from a sample column without the key
+                    if text is not None:
+                        texts[key] = text
+                self._samples[sample] = texts
+        return self._samples
+
+    def formatColumns(self, keys, columns):
+        '''Return the FORMAT values of the given keys in the sample columns numbered columns, as HTSeqRow.formatColumns'''
+        record = self.record
+        samples = record.samples.values()
+        samples = [ samples[i] for i in columns ]
+        out = {}
+        for key in keys:
+            if key in record.format:
+                out[key] = [ formatText(values[key]) for values in samples ]
+            else:
+                out[key] = [None] * len(samples)
+        return out